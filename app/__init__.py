@@ -1,14 +1,23 @@
 from flask import Flask
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, upgrade
 from os import path
 import os
+import sqlite3
+from sqlalchemy import event
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine import Engine
 from dotenv import load_dotenv
 from prometheus_flask_exporter import PrometheusMetrics
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 import logging
 from pythonjsonlogger import jsonlogger
 from flask_restful import Api, Resource
 from flasgger import Swagger, swag_from
+import orjson
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +25,44 @@ load_dotenv()
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
+# Alembic migrations (flask db ...); render_as_batch so ALTERs work on SQLite
+migrate = Migrate(
+    directory=path.join(path.dirname(path.dirname(path.abspath(__file__))), 'migrations'),
+    render_as_batch=True
+)
+
+# Imported once at package import (needs db above) so gunicorn --preload shares it across workers
+from .routes import main, notify_queue
+from .models import BalanceOutbox
+
+# Applied to every new SQLite connection: WAL lets readers proceed during writes and
+# synchronous=NORMAL only fsyncs at checkpoints instead of on every commit.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+    # pysqlite only opens a transaction before statements starting with INSERT/UPDATE/
+    # DELETE (so not WITH ... INSERT); let SQLAlchemy emit BEGIN itself instead.
+    dbapi_connection.isolation_level = None
+
+@event.listens_for(Engine, "begin")
+def begin_sqlite_transaction(conn):
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql("BEGIN")
+
 def mask_pii(record):
     # Mask email/phone in logs
     if hasattr(record, 'email'):
@@ -24,13 +71,102 @@ def mask_pii(record):
         record.phone = "***"
     return True
 
+class LabelChildren(dict):
+    """Children of a single-label metric by label value, resolved on first use and kept."""
+
+    def __init__(self, metric, values=()):
+        super().__init__()
+        self._metric = metric
+        for value in values:
+            self[value]
+
+    def __missing__(self, value):
+        child = self[value] = self._metric.labels(value)
+        return child
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson.
+
+    Used by jsonify() and request.get_json(); types orjson can't encode fall
+    back to Flask's default handler.
+    """
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.option)
+        return self._app.response_class(body, mimetype='application/json')
+
+def engine_options(uri):
+    """SQLAlchemy engine options for the configured database.
+
+    SQLite keeps the default pool and only allows connections to move between
+    threads. Server databases get a sized QueuePool (per worker process) with
+    pre-ping and recycling, and PostgreSQL a server-side statement timeout.
+    """
+    if uri.startswith('sqlite'):
+        # Pooled connections are handed between worker threads
+        return {'connect_args': {'check_same_thread': False}}
+
+    options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 40)),
+        'pool_pre_ping': True,
+        'pool_recycle': 300,
+        'pool_timeout': 5,
+    }
+    if uri.startswith('postgresql'):
+        options['connect_args'] = {'options': f"-c statement_timeout={os.getenv('DB_STATEMENT_TIMEOUT_MS', 2000)}"}
+    return options
+
+def count_dead_outbox_rows(app):
+    """Number of balance_outbox rows marked dead (read at scrape time); NaN when the
+    database can't be reached, so the scrape itself still succeeds."""
+    with app.app_context():
+        try:
+            return db.session.query(BalanceOutbox).filter(BalanceOutbox.dead_ms.isnot(None)).count()
+        except SQLAlchemyError:
+            return float('nan')
+
+def check_schema_revision(app):
+    """Log an error at start-up when the database is not at the latest migration.
+
+    Queries against columns a pending migration adds would otherwise only show up
+    as 500s on every endpoint (e.g. a database file from before a schema change).
+    """
+    with app.app_context():
+        head = ScriptDirectory.from_config(migrate.get_config()).get_current_head()
+        try:
+            with db.engine.connect() as conn:
+                current = MigrationContext.configure(conn).get_current_revision()
+        except SQLAlchemyError as e:
+            app.logger.warning(f"Could not read the database schema revision: {e}")
+            return
+        finally:
+            # Don't hand this connection to forked workers (see RUN_MIGRATIONS below)
+            db.engine.dispose()
+    if current != head:
+        app.logger.error(
+            f"Database schema is at revision {current or '(none)'} but the code expects {head}; "
+            "run `flask db upgrade` (or set RUN_MIGRATIONS=1)"
+            + ("; a database from db.create_all() needs `flask db stamp 0001` first" if current is None else "")
+        )
+
 def create_app():
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
     
-    # Configure SQLite database
+    # Configure database (SQLite unless SQLALCHEMY_DATABASE_URI says otherwise)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///transactions.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///transactions.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
     # Swagger configuration
     app.config['SWAGGER'] = {
@@ -42,6 +178,7 @@ def create_app():
     
     # Initialize database with app
     db.init_app(app)
+    migrate.init_app(app, db)
     # Add Prometheus metrics
     metrics = PrometheusMetrics(app)
     # Custom business metrics
@@ -49,19 +186,36 @@ def create_app():
     app.transactions_total = Counter(
         'transactions_total', 'Total number of transactions', ['txn_type']
     )
+    # Label children resolved once (the common ones up front, any other txn_type on
+    # first use) so the request path skips the labels() lookup
+    app.txn_counters = LabelChildren(
+        app.transactions_total, ('withdrawal', 'deposit', 'transfer', 'unknown')
+    )
     app.failed_transfers_total = Counter(
         'failed_transfers_total', 'Total failed transfer transactions'
     )
     app.balance_check_latency_ms = Histogram(
         'balance_check_latency_ms', 'Latency for balance check', buckets=(10, 50, 100, 250, 500, 1000, 2000)
     )
+    app.notification_queue_depth = Gauge(
+        'notification_queue_depth', 'Notifications queued and not yet sent'
+    )
+    app.notification_queue_depth.set_function(notify_queue.qsize)
+    app.balance_outbox_dead_rows = Gauge(
+        'balance_outbox_dead_rows', 'Balance updates given up on (transactions flagged as failed)'
+    )
+    app.balance_outbox_dead_rows.set_function(lambda: count_dead_outbox_rows(app))
     # Register blueprints
-    from .routes import main
     app.register_blueprint(main)
     
-    # Create database if it doesn't exist
-    with app.app_context():
-        db.create_all()
+    # Schema changes are applied by Alembic; only run them when asked so that
+    # every worker boot doesn't touch the schema
+    if os.getenv('RUN_MIGRATIONS'):
+        with app.app_context():
+            upgrade()
+            # With preload_app this runs in the gunicorn master; don't hand its
+            # pooled connections to the forked workers
+            db.engine.dispose()
     
     # Structured JSON logging
     handler = logging.StreamHandler()
@@ -69,7 +223,13 @@ def create_app():
     handler.setFormatter(formatter)
     app.logger.handlers = [handler]
     app.logger.setLevel(logging.INFO)
+    # Keep records off the root logger, which upgrade() gives Alembic's plain-text
+    # console handler (migrations/env.py fileConfig); they would be logged twice
+    app.logger.propagate = False
     # Add filter for PII masking
     handler.addFilter(mask_pii)
+
+    if not os.getenv('RUN_MIGRATIONS'):
+        check_schema_revision(app)
     
     return app
\ No newline at end of file
@@ -1,38 +1,162 @@
 from . import db
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+import hashlib
+import time
+
+EPOCH = datetime(1970, 1, 1)
+
+def epoch_ms_now():
+    """Current UTC time in epoch milliseconds."""
+    return time.time_ns() // 1_000_000
+
+def to_epoch_ms(value):
+    """Convert a datetime or ISO-8601 string to epoch milliseconds (naive values are UTC)."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+def to_cents(amount):
+    """Convert a currency amount to integer cents."""
+    return int(round(float(amount) * 100))
+
+class iso_from_ms(FunctionElement):
+    """SQL expression: epoch milliseconds -> naive UTC ISO-8601 text, formatted like
+    datetime.isoformat() (the fraction only appears when it is non-zero)."""
+    type = db.String()
+    name = 'iso_from_ms'
+    inherit_cache = True
+
+@compiles(iso_from_ms, 'sqlite')
+def _iso_from_ms_sqlite(element, compiler, **kw):
+    ms = compiler.process(element.clauses, **kw)
+    return (
+        f"(strftime('%Y-%m-%dT%H:%M:%S', {ms} / 1000, 'unixepoch') || "
+        f"CASE WHEN {ms} % 1000 = 0 THEN '' ELSE printf('.%03d000', {ms} % 1000) END)"
+    )
+
+@compiles(iso_from_ms, 'postgresql')
+def _iso_from_ms_postgresql(element, compiler, **kw):
+    ms = compiler.process(element.clauses, **kw)
+    return (
+        f"(to_char(to_timestamp({ms} / 1000) AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS') || "
+        f"CASE WHEN {ms} %% 1000 = 0 THEN '' ELSE '.' || lpad(({ms} %% 1000)::text, 3, '0') || '000' END)"
+    )
 
 class Transaction(db.Model):
     # Use txn_id as the primary key to match the requested table structure
     txn_id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, nullable=True, index=True)
     counterparty_id = db.Column(db.String(128), nullable=True)
-    amount = db.Column(db.Float, nullable=False)
+    # Integer cents: exact sums, no float rounding
+    amount_cents = db.Column(db.BigInteger, nullable=False)
     txn_type = db.Column(db.String(50), nullable=False)
     reference = db.Column(db.String(128), unique=True, nullable=True, index=True)
-    created_dt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Stored as epoch milliseconds: cheap to range-filter and serialized without formatting
+    created_ms = db.Column(db.BigInteger, nullable=False, default=epoch_ms_now)
     failure_status = db.Column(db.String(200), nullable=True)
     correlation_id = db.Column(db.String(128), nullable=True, index=True)
 
+    __table_args__ = (
+        # Covers the per-account daily-limit SUM; on Postgres amount_cents is carried in
+        # the index so the aggregate never touches the heap.
+        db.Index('ix_txn_account_date', 'account_id', 'created_ms', postgresql_include=['amount_cents']),
+    )
+
+    @property
+    def amount(self):
+        """amount_cents as a currency amount."""
+        return self.amount_cents / 100 if self.amount_cents is not None else None
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_cents = to_cents(value) if value is not None else None
+
+    @property
+    def created_dt(self):
+        """created_ms as a naive UTC datetime, for readers that still expect one."""
+        return EPOCH + timedelta(milliseconds=self.created_ms) if self.created_ms is not None else None
+
+    @created_dt.setter
+    def created_dt(self, value):
+        self.created_ms = to_epoch_ms(value) if value is not None else None
+
     def __repr__(self):
         return f'<Transaction {self.txn_id}: {self.txn_type} {self.amount}>'
 
 
+class AccountDailyTotal(db.Model):
+    """Running per-account, per-day sum of transaction.amount_cents.
+
+    Updated in the same database transaction as each insert, so the daily
+    limit check is a single-row upsert instead of a SUM over the day's rows.
+    """
+    __tablename__ = 'account_daily_total'
+
+    account_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    total_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+
 class Idempotency(db.Model):
         """Idempotency mapping keyed by transaction.correlation_id.
 
         Columns:
-            - key: foreign key to transaction.correlation_id
-            - request_hash: hash or identifier of the incoming request
+            - key: the transaction.correlation_id this request created (not a
+              foreign key, since a transfer's two rows share one correlation_id)
+            - request_hash: 128-bit BLAKE2b hex digest of the incoming request (see hash_request)
             - created_at: when the mapping was recorded
 
-        We use a composite primary key (key, request_hash) to ensure uniqueness
-        of a particular request for a specific correlation id.
+        key is the primary key: a correlation id can only ever map to one request,
+        and a second request reusing it is told apart by its request_hash.
         """
         __tablename__ = 'idempotency'
+        # On SQLite store rows in the primary key b-tree itself, so the duplicate probe
+        # by key is a single seek that also yields request_hash
+        __table_args__ = {'sqlite_with_rowid': False}
 
-        key = db.Column(db.String(128), db.ForeignKey('transaction.correlation_id'), primary_key=True)
-        request_hash = db.Column(db.String(128), primary_key=True)
+        key = db.Column(db.String(128), primary_key=True)
+        # Indexed for the importer, which looks mappings up by request_hash alone
+        request_hash = db.Column(db.CHAR(32), nullable=False, index=True)
         created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+        @staticmethod
+        def hash_request(payload):
+            """Return the request_hash for payload bytes.
+
+            Idempotency only needs to tell requests apart, not resist forgery, so a
+            truncated BLAKE2b is used rather than SHA-256.
+            """
+            return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
         # optional relationship to the transaction (correlation_id -> transaction)
-        transaction = db.relationship('Transaction', primaryjoin="Transaction.correlation_id==Idempotency.key", backref='idempotency_mappings', single_parent=True)
\ No newline at end of file
+        transaction = db.relationship('Transaction', primaryjoin="Transaction.correlation_id==foreign(Idempotency.key)", backref='idempotency_mappings', single_parent=True)
+
+class BalanceOutbox(db.Model):
+    """Pending accounts-service update-balance calls (transactional outbox).
+
+    A row is written in the same database transaction as the transaction rows it
+    belongs to, and deleted once the accounts service has accepted the update, so a
+    committed transaction's balance update is never lost (it may be sent more than
+    once if a worker dies between the call and the delete). Updates the accounts
+    service refuses for good are kept with dead_ms set instead of being retried, and
+    their transactions are flagged with failure_status.
+    """
+    __tablename__ = 'balance_outbox'
+    # Due-row scan: live rows (dead_ms IS NULL) in next_attempt_ms order
+    __table_args__ = (db.Index('ix_balance_outbox_due', 'dead_ms', 'next_attempt_ms'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    # JSON list of the txn_ids the update belongs to (NULL on rows queued before 0008)
+    txn_ids = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Earliest time (epoch ms) the row may be (re)sent; also pushed forward while a
+    # worker holds the row
+    next_attempt_ms = db.Column(db.BigInteger, nullable=False, default=epoch_ms_now)
+    created_ms = db.Column(db.BigInteger, nullable=False, default=epoch_ms_now)
+    # When the row was given up on (epoch ms); NULL while it is still being delivered
+    dead_ms = db.Column(db.BigInteger, nullable=True)
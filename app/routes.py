@@ -1,14 +1,536 @@
-from flask import Blueprint, request, jsonify, current_app
-from .models import Transaction, Idempotency
+from flask import Blueprint, request, jsonify, current_app, g, stream_with_context
+from sqlalchemy import delete, exists, insert, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, OperationalError
+from .models import Transaction, Idempotency, AccountDailyTotal, BalanceOutbox, EPOCH, iso_from_ms, epoch_ms_now, to_cents, to_epoch_ms
 from . import db
+from cachetools import TTLCache
+import redis
 import requests
-import hashlib
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import fastjsonschema
+import math
+import random
+import threading
+import queue
 import time
 import os
+from datetime import timedelta
 
 main = Blueprint('main', __name__)
 
+DAILY_LIMIT = 200000
+DAILY_LIMIT_CENTS = DAILY_LIMIT * 100
+DAY_MS = 86_400_000
+# Largest accepted |amount|; keeps amount_cents (and daily sums) well inside BIGINT
+MAX_AMOUNT = 10 ** 15
+_today = (0, 0, None)
+
+# (account_id, day) pairs whose running-total row is known to be committed
+_SEEDED_TOTALS = TTLCache(maxsize=10000, ttl=60)
+_SEEDED_TOTALS_LOCK = threading.Lock()
+
+# Idempotency keys are cached in-process (short TTL) and in Redis when configured
+IDEMPOTENCY_TTL = 86400
+_IDEMPOTENCY_CACHE = TTLCache(maxsize=10000, ttl=60)
+_IDEMPOTENCY_LOCK = threading.Lock()
+_redis = redis.Redis.from_url(os.environ['REDIS_URL']) if os.getenv('REDIS_URL') else None
+
+# POST /transactions body, checked before any other work. Amounts and account ids may
+# also be sent as numeric strings; string lengths match the column sizes.
+_NUMERIC_STRING = r'^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+_validate_transaction = fastjsonschema.compile({
+    'type': 'object',
+    'required': ['amount', 'txn_type'],
+    'properties': {
+        'amount': {'type': ['number', 'string'], 'pattern': _NUMERIC_STRING},
+        'txn_type': {'type': 'string', 'minLength': 1, 'maxLength': 50},
+        'account_id': {'type': ['integer', 'string', 'null'], 'pattern': r'^\s*[-+]?\d+\s*$'},
+        'counterparty_id': {'type': ['integer', 'string', 'null'], 'maxLength': 128},
+        'reference': {'type': ['string', 'null'], 'maxLength': 128},
+        'correlation_id': {'type': ['string', 'null'], 'maxLength': 128},
+        'created_dt': {'type': ['string', 'null']},
+    },
+})
+
+# Pre-rendered bodies for the POST /transactions success responses
+_TRANSACTION_CREATED = b'{"message":"Transaction created successfully","txn_id":%d}'
+_TRANSFER_COMPLETED = b'{"message":"Transfer completed","withdrawal_txn_id":%d,"deposit_txn_id":%d}'
+
+# GET /transactions row shape; amount (from cents) and created_dt (from created_ms)
+# are computed by the database
+_LIST_COLUMNS = (
+    Transaction.txn_id,
+    Transaction.account_id,
+    Transaction.counterparty_id,
+    (db.cast(Transaction.amount_cents, db.Float) / 100).label('amount'),
+    Transaction.txn_type,
+    Transaction.reference,
+    Transaction.created_ms,
+    # Legacy readers still get the ISO timestamp, rendered by the database
+    iso_from_ms(Transaction.created_ms).label('created_dt'),
+    Transaction.failure_status,
+    Transaction.correlation_id,
+)
+
+# On PostgreSQL each row is rendered to JSON by the database and forwarded as-is
+_LIST_JSON = db.cast(
+    db.func.json_build_object(*[part for column in _LIST_COLUMNS for part in (literal(column.key), column)]),
+    db.Text
+)
+
+# Serialized GET /transactions/<id> bodies. A transaction only changes after it is
+# written when its balance update is given up on (failure_status is set by the outbox
+# worker, possibly in another process), so entries expire after a minute.
+_TXN_CACHE = TTLCache(maxsize=65536, ttl=60)
+_TXN_CACHE_LOCK = threading.Lock()
+
+# Shared HTTP session so calls to the accounts/notification services reuse
+# keep-alive connections instead of opening a new one per request
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=64,
+    pool_maxsize=256,
+    max_retries=Retry(total=2, backoff_factor=0.05, status_forcelist=[502, 503, 504])
+)
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.mount('https://', _ADAPTER)
+
+# Downstream endpoints, resolved once at import. ACCOUNTS_SERVICE_URL is the accounts
+# API base (a trailing /check from older configs is tolerated); ACCOUNTS_CHECK_URL and
+# ACCOUNTS_UPDATE_URL override the individual endpoints.
+ACCOUNTS_SERVICE_URL = os.getenv('ACCOUNTS_SERVICE_URL', 'http://accounts-microservice/accounts').rstrip('/').removesuffix('/check')
+ACCOUNTS_CHECK_URL = os.getenv('ACCOUNTS_CHECK_URL') or f'{ACCOUNTS_SERVICE_URL}/check'
+ACCOUNTS_UPDATE_URL = os.getenv('ACCOUNTS_UPDATE_URL') or f'{ACCOUNTS_SERVICE_URL}/update-balance'
+NOTIFICATION_SERVICE_URL = os.getenv('NOTIFICATION_SERVICE_URL', 'http://notification-microservice/notify')
+
+# (connect, read) timeouts: fail fast on an unreachable host, allow time for the reply
+ACCOUNTS_TIMEOUT = (1, 5)
+NOTIFICATION_TIMEOUT = (1, 3)
+
+# Notifications are fire-and-forget: the request thread only queues them and
+# background threads send them (with retries) after the response has gone out
+NOTIFY_QUEUE_SIZE = 10000
+NOTIFY_WORKERS = 4
+NOTIFY_ATTEMPTS = 3
+notify_queue = queue.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+_notifier_pid = None
+_NOTIFIER_LOCK = threading.Lock()
+
+# Balance updates are written to balance_outbox with the transaction and sent to
+# the accounts service by a background thread in each worker process
+OUTBOX_BATCH = 100
+OUTBOX_POLL_SECONDS = 1
+OUTBOX_LEASE_MS = 30_000
+OUTBOX_MAX_BACKOFF_MS = 300_000
+OUTBOX_MAX_ATTEMPTS = 10
+# 4xx replies that are worth retrying; any other 4xx means the update will never succeed
+_RETRYABLE_4XX = (408, 429)
+# failure_status given to transactions whose balance update was given up on
+BALANCE_UPDATE_FAILED = 'FAILURE: BALANCE UPDATE NOT APPLIED'
+_outbox_wakeup = threading.Event()
+_outbox_pid = None
+_OUTBOX_LOCK = threading.Lock()
+
+# GET /transactions page size
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Retries for the charge + insert transaction when the database reports a
+# serialization failure/deadlock (PostgreSQL) or a lock timeout (SQLite)
+WRITE_RETRIES = 3
+_RETRYABLE_PGCODES = ('40001', '40P01')
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _current_day():
+    """Return (start_ms, end_ms, date) for the current UTC day.
+
+    Recomputed only when the clock leaves the cached day; the tuple is swapped in
+    whole, so concurrent readers never see a half-updated value.
+    """
+    global _today
+    now_ms = epoch_ms_now()
+    today = _today
+    if not today[0] <= now_ms < today[1]:
+        start_ms = now_ms - now_ms % DAY_MS
+        today = _today = (start_ms, start_ms + DAY_MS, (EPOCH + timedelta(milliseconds=start_ms)).date())
+    return today
+
+
+def _day_bounds(created_ms):
+    """Return (start_ms, end_ms, date) for the UTC day containing created_ms."""
+    today = _current_day()
+    if today[0] <= created_ms < today[1]:
+        return today
+    start_ms = created_ms - created_ms % DAY_MS
+    return start_ms, start_ms + DAY_MS, (EPOCH + timedelta(milliseconds=start_ms)).date()
+
+
+def _charge_daily_total(account_id, delta, created_ms, checked_amount=None):
+    """Add delta cents to account_id's running total for the UTC day of created_ms.
+
+    If checked_amount (cents) is given, the update is only applied when
+    total + checked_amount stays within DAILY_LIMIT. Returns the new total in cents,
+    or None when the limit would be exceeded (the caller is expected to roll back).
+
+    Must run before the request's own transaction rows are flushed, since the first
+    charge of a day seeds the total from the rows already written for that day.
+    """
+    start_of_day, end_of_day, day = _day_bounds(created_ms)
+    insert = _UPSERT_DIALECTS[db.session.get_bind().dialect.name]
+
+    with _SEEDED_TOTALS_LOCK:
+        seeded = (account_id, day) in _SEEDED_TOTALS
+    if seeded:
+        # The day's row is known to exist, so skip the seed query entirely
+        stmt = insert(AccountDailyTotal).values(account_id=account_id, day=day, total_cents=delta)
+    else:
+        # Seed: the day's SUM, only evaluated while the account has no row for that day yet
+        # (the NOT EXISTS is uncorrelated, so the planner checks it once before scanning).
+        day_sum = select(
+            db.func.coalesce(db.func.sum(Transaction.amount_cents), 0).label('total')
+        ).where(
+            Transaction.account_id == account_id,
+            Transaction.created_ms >= start_of_day,
+            Transaction.created_ms < end_of_day,
+            ~exists().where(AccountDailyTotal.account_id == account_id, AccountDailyTotal.day == day)
+        ).cte('day_sum')
+
+        # SQLite can only parse ON CONFLICT after INSERT ... SELECT when the SELECT has a WHERE
+        seed = select(literal(account_id), literal(day), day_sum.c.total + delta).where(
+            (day_sum.c.total + checked_amount <= DAILY_LIMIT_CENTS) if checked_amount is not None else true()
+        )
+        stmt = insert(AccountDailyTotal).from_select(['account_id', 'day', 'total_cents'], seed)
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AccountDailyTotal.account_id, AccountDailyTotal.day],
+        set_={'total_cents': AccountDailyTotal.total_cents + delta},
+        where=(AccountDailyTotal.total_cents + checked_amount <= DAILY_LIMIT_CENTS) if checked_amount is not None else None
+    ).returning(AccountDailyTotal.total_cents)
+    total = db.session.execute(stmt).scalar()
+    if total is not None:
+        g.setdefault('charged_daily_totals', []).append((account_id, day))
+    return total
+
+
+def _mark_daily_totals_seeded():
+    """Call after commit: remember the (account, day) totals this request wrote, so
+    later charges for them can skip the seed query."""
+    charged = g.pop('charged_daily_totals', ())
+    with _SEEDED_TOTALS_LOCK:
+        for key in charged:
+            _SEEDED_TOTALS[key] = True
+
+
+def _insert_transactions(rows, correlation_id, request_hash):
+    """Insert transaction rows (dicts) and, if correlation_id is set, the idempotency mapping.
+
+    All rows go out as one batched INSERT ... RETURNING; each row's generated txn_id is
+    stored back on it. Does not commit.
+    """
+    txn_ids = db.session.execute(
+        insert(Transaction).returning(Transaction.txn_id, sort_by_parameter_order=True),
+        rows
+    ).scalars().all()
+    for row, txn_id in zip(rows, txn_ids):
+        row['txn_id'] = txn_id
+
+    if correlation_id:
+        db.session.execute(insert(Idempotency).values(key=correlation_id, request_hash=request_hash))
+
+
+def _is_retryable(err):
+    """True if an OperationalError means the transaction lost a race and can be rerun."""
+    orig = err.orig
+    return getattr(orig, 'pgcode', None) in _RETRYABLE_PGCODES or 'database is locked' in str(orig)
+
+
+def _write_transactions(rows, charges, correlation_id, request_hash, balance_update):
+    """Charge the daily totals, insert rows and queue balance_update (the accounts
+    service update-balance payload) in the outbox in one transaction, then commit.
+
+    charges is a list of (account_id, delta_cents, checked_amount, created_ms) tuples
+    passed to _charge_daily_total. Returns False (after rolling back) if a checked charge would
+    exceed the daily limit, True once committed. Retryable failures are rerun up to
+    WRITE_RETRIES times with jittered exponential backoff; anything else is raised
+    (an IntegrityError after rolling back, e.g. when a concurrent request committed
+    the same correlation_id first).
+    """
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            for account_id, delta, checked_amount, created_ms in charges:
+                if _charge_daily_total(account_id, delta, created_ms, checked_amount=checked_amount) is None:
+                    db.session.rollback()
+                    g.pop('charged_daily_totals', None)
+                    return False
+            _insert_transactions(rows, correlation_id, request_hash)
+            db.session.execute(insert(BalanceOutbox).values(
+                payload=orjson.dumps(balance_update).decode(),
+                txn_ids=orjson.dumps([row['txn_id'] for row in rows]).decode()
+            ))
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            g.pop('charged_daily_totals', None)
+            raise
+        except OperationalError as e:
+            db.session.rollback()
+            g.pop('charged_daily_totals', None)
+            for row in rows:
+                row.pop('txn_id', None)
+            if attempt == WRITE_RETRIES or not _is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+    _mark_daily_totals_seeded()
+    _outbox_wakeup.set()
+    return True
+
+
+def _process_outbox(logger):
+    """Send due balance_outbox rows to the accounts service; returns the number of rows seen.
+
+    Each row is claimed first by moving next_attempt_ms forward from the value that was
+    read (only one worker's UPDATE can match), so concurrent workers don't send it
+    twice. Sent rows are deleted; failed ones are rescheduled with exponential backoff.
+    A row is marked dead (dead_ms set, never sent again) on a non-retryable 4xx reply or
+    after OUTBOX_MAX_ATTEMPTS failures; its transactions get BALANCE_UPDATE_FAILED as
+    their failure_status in the same commit, so the client can see the 201 didn't stick.
+    """
+    now = epoch_ms_now()
+    due = db.session.execute(
+        select(
+            BalanceOutbox.id, BalanceOutbox.payload, BalanceOutbox.txn_ids,
+            BalanceOutbox.attempts, BalanceOutbox.next_attempt_ms
+        )
+        .where(BalanceOutbox.dead_ms.is_(None), BalanceOutbox.next_attempt_ms <= now)
+        .order_by(BalanceOutbox.next_attempt_ms)
+        .limit(OUTBOX_BATCH)
+    ).all()
+    db.session.commit()
+
+    for row in due:
+        claimed = db.session.execute(
+            update(BalanceOutbox)
+            .where(BalanceOutbox.id == row.id, BalanceOutbox.next_attempt_ms == row.next_attempt_ms)
+            .values(next_attempt_ms=now + OUTBOX_LEASE_MS)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            continue
+
+        terminal = False
+        try:
+            resp = _SESSION.post(ACCOUNTS_UPDATE_URL, json=orjson.loads(row.payload), timeout=ACCOUNTS_TIMEOUT)
+            error = None if resp.status_code == 200 else f"HTTP {resp.status_code}: {resp.text}"
+            terminal = 400 <= resp.status_code < 500 and resp.status_code not in _RETRYABLE_4XX
+        except requests.exceptions.RequestException as e:
+            error = e
+
+        if error is None:
+            db.session.execute(delete(BalanceOutbox).where(BalanceOutbox.id == row.id))
+        elif terminal or row.attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+            txn_ids = orjson.loads(row.txn_ids) if row.txn_ids else []
+            logger.error(
+                f"Balance update {row.id} for transactions {txn_ids} abandoned after "
+                f"{row.attempts + 1} attempt(s): {error}"
+            )
+            db.session.execute(
+                update(BalanceOutbox)
+                .where(BalanceOutbox.id == row.id)
+                .values(attempts=row.attempts + 1, dead_ms=epoch_ms_now())
+            )
+            if txn_ids:
+                db.session.execute(
+                    update(Transaction)
+                    .where(Transaction.txn_id.in_(txn_ids), Transaction.failure_status.is_(None))
+                    .values(failure_status=BALANCE_UPDATE_FAILED)
+                )
+                with _TXN_CACHE_LOCK:
+                    for txn_id in txn_ids:
+                        _TXN_CACHE.pop(txn_id, None)
+        else:
+            logger.warning(f"Balance update {row.id} failed (attempt {row.attempts + 1}): {error}")
+            db.session.execute(
+                update(BalanceOutbox)
+                .where(BalanceOutbox.id == row.id)
+                .values(
+                    attempts=row.attempts + 1,
+                    next_attempt_ms=epoch_ms_now() + min(1000 * 2 ** row.attempts, OUTBOX_MAX_BACKOFF_MS)
+                )
+            )
+        db.session.commit()
+    return len(due)
+
+
+def _run_outbox(app):
+    """Outbox thread: send due balance updates, then wait to be woken by a commit
+    (or for the next poll)."""
+    while True:
+        _outbox_wakeup.clear()
+        with app.app_context():
+            try:
+                seen = _process_outbox(app.logger)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.warning(f"Balance outbox pass failed: {e}")
+                seen = 0
+        if seen < OUTBOX_BATCH:
+            _outbox_wakeup.wait(OUTBOX_POLL_SECONDS)
+
+
+@main.before_app_request
+def _start_outbox_worker():
+    """Start this process's outbox thread on its first request (i.e. after any fork),
+    so balance updates left over from a previous run are sent too."""
+    global _outbox_pid
+    if _outbox_pid == os.getpid():
+        return
+    with _OUTBOX_LOCK:
+        if _outbox_pid != os.getpid():
+            threading.Thread(
+                target=_run_outbox, args=(current_app._get_current_object(),), name='balance-outbox', daemon=True
+            ).start()
+            _outbox_pid = os.getpid()
+
+
+def _notify(url, payload, logger):
+    """POST a notification, retrying with backoff; failures are logged, never raised."""
+    for attempt in range(NOTIFY_ATTEMPTS):
+        try:
+            resp = _SESSION.post(url, json=payload, timeout=NOTIFICATION_TIMEOUT)
+            if resp.status_code < 500:
+                return
+            notify_err = f"HTTP {resp.status_code}"
+        except Exception as e:
+            notify_err = e
+        if attempt + 1 < NOTIFY_ATTEMPTS:
+            time.sleep(0.1 * 2 ** attempt)
+    logger.warning(f"Notification service call failed for txn_id {payload['txn_id']}: {notify_err}")
+
+
+def _drain_notifications():
+    """Notification thread: send queued notifications forever."""
+    while True:
+        url, payload, logger = notify_queue.get()
+        _notify(url, payload, logger)
+        notify_queue.task_done()
+
+
+def _start_notifier():
+    """Start the notification threads for this process.
+
+    Started lazily rather than in create_app: with gunicorn's preload_app the app is
+    created in the master, and threads started there don't survive the fork.
+    """
+    global _notifier_pid
+    with _NOTIFIER_LOCK:
+        if _notifier_pid == os.getpid():
+            return
+        for i in range(NOTIFY_WORKERS):
+            threading.Thread(target=_drain_notifications, name=f'notify-{i}', daemon=True).start()
+        _notifier_pid = os.getpid()
+
+
+def _queue_notification(url, payload):
+    """Queue a notification for the background threads; dropped (and logged) if the queue is full."""
+    if _notifier_pid != os.getpid():
+        _start_notifier()
+    try:
+        notify_queue.put_nowait((url, payload, current_app.logger))
+    except queue.Full:
+        current_app.logger.warning(f"Notification queue full, dropping notification for txn_id {payload['txn_id']}")
+
+
+def _lookup_idempotency(key):
+    """Return the original txn_id cached for an idempotency key, or None.
+
+    Checks the in-process cache first, then Redis when REDIS_URL is configured.
+    Redis errors are treated as a miss so the database check still runs.
+    """
+    with _IDEMPOTENCY_LOCK:
+        txn_id = _IDEMPOTENCY_CACHE.get(key)
+    if txn_id is None and _redis is not None:
+        try:
+            value = _redis.get(key)
+        except redis.RedisError:
+            value = None
+        if value is not None:
+            txn_id = int(value)
+            with _IDEMPOTENCY_LOCK:
+                _IDEMPOTENCY_CACHE[key] = txn_id
+    return txn_id
+
+
+def _remember_idempotency(key, txn_id):
+    """Cache the txn_id for an idempotency key once it is committed."""
+    with _IDEMPOTENCY_LOCK:
+        _IDEMPOTENCY_CACHE[key] = txn_id
+    if _redis is not None:
+        try:
+            _redis.set(key, txn_id, nx=True, ex=IDEMPOTENCY_TTL)
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Failed to cache idempotency key {key}: {e}")
+
+
+def _idempotent_replay(correlation_id, request_hash, idempotency_key):
+    """Return the 409/422 response for a correlation_id that already has a mapping, or None."""
+    # Fetch only the key's stored hash and the original txn_id (a transfer's two rows
+    # share the correlation_id; the withdrawal, written first, is the original)
+    existing = db.session.execute(
+        select(Idempotency.request_hash, Transaction.txn_id)
+        .select_from(Idempotency)
+        .outerjoin(Transaction, Transaction.correlation_id == Idempotency.key)
+        .where(Idempotency.key == correlation_id)
+        .order_by(Transaction.txn_id)
+        .limit(1)
+    ).first()
+    if existing is None:
+        return None
+
+    if existing.request_hash != request_hash:
+        # Same key, different payload: the client reused a correlation_id
+        return jsonify({
+            'error': f'correlation_id {correlation_id} was already used for a different request'
+        }), 422
+
+    # Duplicate request — return conflict and reference the original transaction if available
+    orig_id = existing.txn_id
+    if orig_id is not None:
+        _remember_idempotency(idempotency_key, orig_id)
+    return jsonify({
+        'message': 'Duplicate transaction',
+        'original_txn_id': orig_id
+    }), 409  # Conflict status code
+
+
+def _write_or_replay(rows, charges, correlation_id, request_hash, idempotency_key, balance_update):
+    """Run _write_transactions and return None once committed, or the response to send.
+
+    A concurrent request that committed the same correlation_id first makes the
+    idempotency insert violate the unique key; that is answered like the up-front
+    duplicate check (409/422) instead of as a server error.
+    """
+    try:
+        written = _write_transactions(rows, charges, correlation_id, request_hash, balance_update)
+    except IntegrityError:
+        replay = _idempotent_replay(correlation_id, request_hash, idempotency_key) if correlation_id else None
+        if replay is None:
+            raise
+        return replay
+    if not written:
+        return jsonify({'error': f'Daily transaction limit of {DAILY_LIMIT} exceeded for account {rows[0]["account_id"]}'}), 400
+    return None
+
+
 # Route to create transaction
 @main.route('/transactions', methods=['POST'])
 def create_transaction():
@@ -48,6 +570,10 @@ def create_transaction():
             correlation_id:
               type: string
               description: A unique ID for ensuring idempotency of the request.
+            created_dt:
+              type: string
+              format: date-time
+              description: Optional ISO-8601 creation time (UTC if no offset); defaults to now.
     responses:
       201:
         description: Transaction created successfully.
@@ -81,6 +607,13 @@ def create_transaction():
               type: string
             original_txn_id:
               type: integer
+      422:
+        description: Unprocessable Entity - The correlation_id was already used for a different request payload.
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
       500:
         description: Internal Server Error.
         schema:
@@ -89,7 +622,7 @@ def create_transaction():
             error: 
               type: string
       502:
-        description: Bad Gateway - Error communicating with a downstream service.
+        description: Bad Gateway - Error communicating with the accounts service during the transfer check. (Balance updates are sent asynchronously after the transaction is committed.)
         schema:
           type: object
           properties:
@@ -100,88 +633,69 @@ def create_transaction():
     data = request.get_json() or {}
     start_time = time.time()
 
-    from datetime import datetime, timedelta
-    DAILY_LIMIT = 200000
-
-    # Fetch external service URLs from environment variables
-    ACCOUNTS_SERVICE_URL = os.getenv("ACCOUNTS_SERVICE_URL", "http://accounts-microservice/accounts/check")
-    NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://notification-microservice/notify")
+    # Validate the body shape before touching the database
+    try:
+        _validate_transaction(data)
+    except fastjsonschema.JsonSchemaException as e:
+        return jsonify({'error': f'Invalid request: {e.message}'}), 400
 
-    # Minimal required fields
-    if 'amount' not in data or 'txn_type' not in data:
-        return jsonify({'error': 'Missing required fields: amount and txn_type'}), 400
+    amount = float(data['amount'])
+    if not math.isfinite(amount) or abs(amount) > MAX_AMOUNT:
+        return jsonify({'error': 'Invalid amount'}), 400
+    amount_cents = to_cents(amount)
 
-    # Enforce daily transaction limit per account (apply when account_id present)
+    created_dt = data.get('created_dt')
     try:
-        amount = float(data.get('amount') or 0)
-    except Exception:
-        return jsonify({'error': 'Invalid amount'}), 400
+        created_ms = to_epoch_ms(created_dt) if created_dt else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid created_dt'}), 400
 
+    # Request fields used below, read once
     account_id = data.get('account_id')
-    if account_id:
-        try:
-            today = datetime.utcnow().date()
-            start_of_day = datetime(today.year, today.month, today.day)
-            end_of_day = start_of_day + timedelta(days=1)
-            total_today = db.session.query(db.func.coalesce(db.func.sum(Transaction.amount), 0)).filter(
-                Transaction.account_id == int(account_id),
-                Transaction.created_dt >= start_of_day,
-                Transaction.created_dt < end_of_day
-            ).scalar() or 0
-            if total_today + amount > DAILY_LIMIT:
-                return jsonify({'error': f'Daily transaction limit of {DAILY_LIMIT} exceeded for account {account_id}'}), 400
-        except Exception as e:
-            # If query fails, return an error rather than proceeding silently
-            return jsonify({'error': f'Error checking daily limit: {str(e)}'}), 500
-
-    # Generate request hash for idempotency check
-    request_data = {k: v for k, v in sorted(data.items()) if k != 'correlation_id'}
-    request_hash = hashlib.sha256(json.dumps(request_data).encode()).hexdigest()
-
-    # Check for duplicate transaction using Idempotency table
-    if data.get('correlation_id'):
-        existing_idempotency = Idempotency.query.filter_by(
-            key=data['correlation_id'],
-            request_hash=request_hash
-        ).first()
-        
-        if existing_idempotency:
-            # Duplicate request — return conflict and reference existing mapping if available
-            try:
-                original_txn_id = getattr(existing_idempotency, 'transaction', None)
-                orig_id = original_txn_id.txn_id if original_txn_id else None
-            except Exception:
-                orig_id = None
+    counterparty_id = data.get('counterparty_id')
+    correlation_id = data.get('correlation_id')
+    reference = data.get('reference')
+    txn_type = data.get('txn_type', 'unknown')
+
+    # Enforce daily transaction limit per account (apply when account_id present).
+    # The running total is charged when the transaction is written; a single amount
+    # over the limit can be rejected without touching the database.
+    if account_id and amount > DAILY_LIMIT:
+        return jsonify({'error': f'Daily transaction limit of {DAILY_LIMIT} exceeded for account {account_id}'}), 400
+
+    # Check for duplicate transaction: recent keys are answered from the cache,
+    # anything else falls through to the Idempotency table. The request hash is only
+    # needed (and computed) when the client sent a correlation_id.
+    request_hash = idempotency_key = None
+    if correlation_id:
+        request_data = {k: v for k, v in data.items() if k != 'correlation_id'}
+        request_hash = Idempotency.hash_request(orjson.dumps(request_data, option=orjson.OPT_SORT_KEYS))
+        idempotency_key = f"idemp:{correlation_id}:{request_hash}"
+        cached_txn_id = _lookup_idempotency(idempotency_key)
+        if cached_txn_id is not None:
             return jsonify({
                 'message': 'Duplicate transaction',
-                'original_txn_id': orig_id
-            }), 409  # Conflict status code
+                'original_txn_id': cached_txn_id
+            }), 409
+
+        replay = _idempotent_replay(correlation_id, request_hash, idempotency_key)
+        if replay is not None:
+            return replay
 
     failure_status = None
-    txn_type = data.get('txn_type', 'unknown')
 
     # For transfer transactions, validate and create two separate records (withdrawal + deposit)
     if txn_type == 'transfer':
-        account_id = data.get('account_id')
-        counterparty_id = data.get('counterparty_id')
-        try:
-            amount = float(data['amount'])
-        except Exception:
-            return jsonify({'error': 'Invalid amount for transfer'}), 400
-
         if not account_id or not counterparty_id:
             return jsonify({'error': 'account_id and counterparty_id required for transfer'}), 400
 
-        # Use ACCOUNTS_SERVICE_URL from env
-        accounts_check_url = f"{ACCOUNTS_SERVICE_URL.rstrip('/')}/check"
-
         # Validate account/counterparty status and balance (no overdraft allowed)
         try:
             with current_app.balance_check_latency_ms.time():
-                resp = requests.post(
-                    accounts_check_url,
+                resp = _SESSION.post(
+                    ACCOUNTS_CHECK_URL,
                     json={'account_id': account_id, 'counterparty_id': counterparty_id},
-                    timeout=5
+                    timeout=ACCOUNTS_TIMEOUT
                 )
 
             if resp.status_code != 200:
@@ -210,87 +724,68 @@ def create_transaction():
         # Create withdrawal and deposit records atomically
         try:
             # withdrawal: from sender account (store negative amount to reflect debit)
-            withdrawal = Transaction(
-                account_id=int(account_id),
-                counterparty_id=counterparty_id,
-                amount=-abs(amount),
-                txn_type='withdrawal',
-                reference=data.get('reference'),
-                created_dt=data.get('created_dt'),
-                failure_status=None,
-                correlation_id=data.get('correlation_id')
-            )
+            withdrawal = {
+                'account_id': int(account_id),
+                'counterparty_id': counterparty_id,
+                'amount_cents': -abs(amount_cents),
+                'txn_type': 'withdrawal',
+                'reference': reference,
+                'created_ms': created_ms or epoch_ms_now(),
+                'failure_status': None,
+                'correlation_id': correlation_id
+            }
 
             # deposit: to counterparty account (positive amount)
-            deposit = Transaction(
-                account_id=int(counterparty_id),
-                counterparty_id=account_id,
-                amount=abs(amount),
-                txn_type='deposit',
-                reference=data.get('reference'),
-                created_dt=data.get('created_dt'),
-                failure_status=None,
-                correlation_id=data.get('correlation_id')
-            )
-
-            db.session.add(withdrawal)
-            db.session.add(deposit)
+            deposit = {
+                'account_id': int(counterparty_id),
+                'counterparty_id': account_id,
+                'amount_cents': abs(amount_cents),
+                'txn_type': 'deposit',
+                'reference': reference,
+                'created_ms': created_ms or epoch_ms_now(),
+                'failure_status': None,
+                'correlation_id': correlation_id
+            }
 
-            # Create idempotency record if correlation_id exists
-            if data.get('correlation_id'):
-                idempotency = Idempotency(
-                    key=data['correlation_id'],
-                    request_hash=request_hash
-                )
-                db.session.add(idempotency)
-            db.session.commit()
+            # Charge the daily totals in the same transaction as the inserts
+            # (only the sender's total is checked against the limit)
+            charges = [
+                (withdrawal['account_id'], withdrawal['amount_cents'], amount_cents, withdrawal['created_ms']),
+                (deposit['account_id'], deposit['amount_cents'], None, deposit['created_ms']),
+            ]
+            # The accounts service balance update goes out through the outbox once committed
+            update_payload = {
+                "account_id": account_id,
+                "counterparty_id": counterparty_id,
+                "amount": amount,
+                "txn_type": txn_type
+            }
+            failed = _write_or_replay(
+                [withdrawal, deposit], charges, correlation_id, request_hash, idempotency_key, update_payload
+            )
+            if failed is not None:
+                return failed
+            if idempotency_key:
+                _remember_idempotency(idempotency_key, withdrawal['txn_id'])
 
             # Update metrics for both records
-            current_app.transactions_total.labels(txn_type='withdrawal').inc()
-            current_app.transactions_total.labels(txn_type='deposit').inc()
-
-            # Update the accounts service 
-            try:
-                update_payload = {
-                  "account_id": account_id,
-                  "counterparty_id": counterparty_id,
-                  "amount": amount,
-                  "txn_type": txn_type
-                }
-                account_update_url= f"{ACCOUNTS_SERVICE_URL.rstrip('/')}/update-balance"
-                
-                balance_resp= requests.post(
-                  account_update_url,
-                  json=update_payload,
-                  timeout=5
-                )
-                if balance_resp.status_code!=200:
-                  return jsonify({
-                    "error":"Balance update failed",
-                    "details":balance_resp.text
-                  }), 502
-            except Exception as e:
-              return jsonify({
-                "error":f"Error contacting account service: {str(e)}"
-              }), 502
+            current_app.txn_counters['withdrawal'].inc()
+            current_app.txn_counters['deposit'].inc()
 
             # Notify external notification service for both transactions
+            # (sent in the background; the response doesn't wait for them)
             for tx in [withdrawal, deposit]:
-                try:
-                    notification_payload = {
-                        "txn_id": tx.txn_id or tx.id,
-                        "reference": tx.reference,
-                        "status": "success"
-                    }
-                    requests.post(NOTIFICATION_SERVICE_URL, json=notification_payload, timeout=3)
-                except Exception as notify_err:
-                    current_app.logger.warning(f"Notification service call failed for txn_id {tx.txn_id or tx.id}: {notify_err}")
+                notification_payload = {
+                    "txn_id": tx['txn_id'],
+                    "reference": tx['reference'],
+                    "status": "success"
+                }
+                _queue_notification(NOTIFICATION_SERVICE_URL, notification_payload)
 
-            return jsonify({
-                'message': 'Transfer completed',
-                'withdrawal_txn_id': withdrawal.txn_id or withdrawal.id,
-                'deposit_txn_id': deposit.txn_id or deposit.id
-            }), 201
+            return current_app.response_class(
+                _TRANSFER_COMPLETED % (withdrawal['txn_id'], deposit['txn_id']),
+                status=201, mimetype='application/json'
+            )
 
         except Exception as e:
             db.session.rollback()
@@ -298,72 +793,47 @@ def create_transaction():
 
     # Create transaction (non-transfer)
     try:
-        txn = Transaction(
-            account_id=int(data['account_id']) if data.get('account_id') else None,
-            counterparty_id=data.get('counterparty_id'),
-            amount=float(data['amount']),
-            txn_type=data.get('txn_type'),
-            reference=data.get('reference'),
-            created_dt=data.get('created_dt'),
-            failure_status=failure_status,
-            correlation_id=data.get('correlation_id')
-        )
-
-        # Create idempotency record if correlation_id exists
-        if data.get('correlation_id'):
-            idempotency = Idempotency(
-                key=data['correlation_id'],
-                request_hash=request_hash
-            )
-            db.session.add(idempotency)
-
-        db.session.add(txn)
-        db.session.commit()
+        txn = {
+            'account_id': int(account_id) if account_id else None,
+            'counterparty_id': counterparty_id,
+            'amount_cents': amount_cents,
+            'txn_type': txn_type,
+            'reference': reference,
+            'created_ms': created_ms or epoch_ms_now(),
+            'failure_status': failure_status,
+            'correlation_id': correlation_id
+        }
+        charges = [(txn['account_id'], amount_cents, amount_cents, txn['created_ms'])] if account_id else []
+        # The accounts service balance update goes out through the outbox once committed
+        update_payload = {
+            "account_id": account_id,
+            "amount": amount,
+            "txn_type": txn_type
+        }
+        failed = _write_or_replay([txn], charges, correlation_id, request_hash, idempotency_key, update_payload)
+        if failed is not None:
+            return failed
+        if idempotency_key:
+            _remember_idempotency(idempotency_key, txn['txn_id'])
         
         # Business metric: increment total transactions
-        current_app.transactions_total.labels(txn_type=txn.txn_type or 'unknown').inc()
-        
-        #Update Account Service Balance
-        try:
-          update_payload = {
-                  "account_id": account_id,
-                  "amount": amount,
-                  "txn_type": txn_type
-          }
-          account_update_url= f"{ACCOUNTS_SERVICE_URL.rstrip('/')}/update-balance"
-                
-          balance_resp= requests.post(
-            account_update_url,
-            json=update_payload,
-            timeout=5
-          )
-          if balance_resp.status_code!=200:
-            return jsonify({
-                    "error":"Balance update failed",
-                    "details":balance_resp.text
-                  }), 502
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': f'Error creating transfer transactions: {str(e)}'}), 500
-          
+        current_app.txn_counters[txn['txn_type'] or 'unknown'].inc()
         
-
-        # Notify external notification service
-        try:
-            notification_payload = {
-                "txn_id": txn.txn_id,
-                "reference": txn.reference,
-                "status": "failed" if failure_status else "success"
-            }
-            requests.post(NOTIFICATION_SERVICE_URL, json=notification_payload, timeout=3)
-        except Exception as notify_err:
-            current_app.logger.warning(f"Notification service call failed for txn_id {txn.txn_id}: {notify_err}")
+        # Notify external notification service (in the background)
+        notification_payload = {
+            "txn_id": txn['txn_id'],
+            "reference": txn['reference'],
+            "status": "failed" if failure_status else "success"
+        }
+        _queue_notification(NOTIFICATION_SERVICE_URL, notification_payload)
 
         if failure_status:
-            if txn.txn_type == 'transfer':
+            if txn['txn_type'] == 'transfer':
                 current_app.failed_transfers_total.inc()
-            return jsonify({'message': 'Transaction failed', 'txn_id': txn.txn_id, 'failure_status': failure_status}), 201
-        return jsonify({'message': 'Transaction created successfully', 'txn_id': txn.txn_id}), 201
+            return jsonify({'message': 'Transaction failed', 'txn_id': txn['txn_id'], 'failure_status': failure_status}), 201
+        return current_app.response_class(
+            _TRANSACTION_CREATED % txn['txn_id'], status=201, mimetype='application/json'
+        )
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -374,13 +844,30 @@ def create_transaction():
 def get_transactions():
     """
     Get all transactions.
-    This endpoint retrieves a list of all transactions in the system.
+    This endpoint retrieves transactions in pages ordered by txn_id (keyset pagination).
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page;
+    the header is omitted on the last page.
     ---
     tags:
       - Transactions
+    parameters:
+      - name: cursor
+        in: query
+        type: integer
+        required: false
+        description: Return transactions with txn_id greater than this value.
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size (default 500, max 5000).
     responses:
       200:
         description: A list of transactions.
+        headers:
+          X-Next-Cursor:
+            type: integer
+            description: Cursor for the next page, if there is one.
         schema:
           type: array
           items:
@@ -403,26 +890,50 @@ def get_transactions():
           amount: { type: number, format: float }
           txn_type: { type: string }
           reference: { type: string }
-          created_dt: { type: string, format: 'date-time' }
+          created_ms: { type: integer, format: int64, description: 'Creation time in epoch milliseconds (UTC)' }
+          created_dt: { type: string, format: 'date-time', description: 'Creation time as ISO-8601 UTC (same instant as created_ms)' }
           failure_status: { type: string }
           correlation_id: { type: string }
     """
+    cursor = request.args.get('cursor', 0, type=int)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
     try:
-        transactions = Transaction.query.all()
-        return jsonify([{
-            'txn_id': t.txn_id,
-            'account_id': t.account_id,
-            'counterparty_id': t.counterparty_id,
-            'amount': t.amount,
-            'txn_type': t.txn_type,
-            'reference': t.reference,
-            'created_dt': t.created_dt.isoformat() if t.created_dt else None,
-            'failure_status': t.failure_status,
-            'correlation_id': t.correlation_id
-        } for t in transactions]), 200
+        # Plain column rows (no ORM instances) go straight to orjson; PostgreSQL
+        # builds the JSON text itself
+        server_json = db.session.get_bind().dialect.name == 'postgresql'
+        columns = (_LIST_JSON,) if server_json else _LIST_COLUMNS
+        page = select(*columns).where(Transaction.txn_id > cursor).order_by(Transaction.txn_id)
+
+        # Headers go out before the body, so look up the last id of the page up front
+        # (a PK-only probe) instead of waiting for the stream to finish. The probe also
+        # reads the row after it: without one this is the last page and gets no cursor.
+        probe = db.session.execute(
+            page.with_only_columns(Transaction.txn_id).offset(limit - 1).limit(2)
+        ).scalars().all()
+        last_id = probe[0] if len(probe) == 2 else None
+
+        result = db.session.execute(page.limit(limit).execution_options(yield_per=PAGE_SIZE))
+        if server_json:
+            rows = (body.encode() for body in result.scalars())
+        else:
+            rows = (orjson.dumps(dict(row)) for row in result.mappings())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    def generate():
+        yield b'['
+        for i, row in enumerate(rows):
+            if i:
+                yield b','
+            yield row
+        yield b']'
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+    if last_id is not None:
+        response.headers['X-Next-Cursor'] = str(last_id)
+    return response
+
 
 # Route to fetch specific transaction by id
 @main.route('/transactions/<int:txn_id>', methods=['GET'])
@@ -454,18 +965,21 @@ def get_transaction(txn_id):
             error:
               type: string
     """
+    with _TXN_CACHE_LOCK:
+        body = _TXN_CACHE.get(txn_id)
+    if body is not None:
+        return current_app.response_class(body, mimetype='application/json')
+
     try:
-        transaction = Transaction.query.get_or_404(txn_id)
-        return jsonify({
-            'txn_id': transaction.txn_id,
-            'account_id': transaction.account_id,
-            'counterparty_id': transaction.counterparty_id,
-            'amount': transaction.amount,
-            'txn_type': transaction.txn_type,
-            'reference': transaction.reference,
-            'created_dt': transaction.created_dt.isoformat() if transaction.created_dt else None,
-            'failure_status': transaction.failure_status,
-            'correlation_id': transaction.correlation_id
-        }), 200
+        # Same column row as GET /transactions: no ORM instance, straight to orjson
+        row = db.session.execute(
+            select(*_LIST_COLUMNS).where(Transaction.txn_id == txn_id)
+        ).mappings().first()
+        if row is None:
+            return jsonify({'error': f'Transaction {txn_id} not found'}), 404
+        body = orjson.dumps(dict(row))
+        with _TXN_CACHE_LOCK:
+            _TXN_CACHE[txn_id] = body
+        return current_app.response_class(body, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -1,11 +1,12 @@
 from app import db
 from app import models
+from flask_migrate import upgrade
 
 def create_all_tables():
     from app import create_app
     app = create_app()
     with app.app_context():
-        db.create_all()
+        upgrade()
         print("All tables created successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import os
+
+# The request path is dominated by calls to the accounts/notification services, so
+# workers are gevent-based: a worker keeps serving other requests while one waits
+# on the network instead of blocking the whole process.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+
+# Patch the stdlib here, before the app is imported: with preload_app the master
+# imports the app (requests, threading locks, the DB driver) before gunicorn's gevent
+# worker would patch, leaving blocking sockets and real thread locks behind.
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+    # Cooperative waits in psycopg2 too, when it is installed
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        pass
+    else:
+        patch_psycopg()
+
+import multiprocessing
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+# Import the app once in the master and fork workers from it (copy-on-write), so
+# start-up work such as migrations (RUN_MIGRATIONS) runs once rather than per worker
+preload_app = True
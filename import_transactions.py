@@ -1,11 +1,16 @@
 import csv
-from datetime import datetime
+import io
+from collections import defaultdict
+from datetime import datetime, timedelta
 from app import create_app, db
-from app.models import Transaction, Idempotency
+from flask_migrate import downgrade, upgrade
+from app.models import Transaction, Idempotency, AccountDailyTotal, EPOCH, epoch_ms_now, to_cents, to_epoch_ms
+from itertools import islice
+from sqlalchemy import bindparam, or_, select, text, update
 import os
-import hashlib
 import uuid
 import argparse
+import orjson
 import sys
 
 
@@ -20,121 +25,325 @@ def parse_date(date_str):
         return None
 
 
-def import_transactions(csv_file, force_recreate=False):
+# Rows per bulk insert/update; each chunk is committed as one transaction
+CHUNK_SIZE = 1000
+
+# Transaction columns carried in the bulk update mappings
+UPDATE_COLUMNS = ('account_id', 'counterparty_id', 'amount_cents', 'txn_type', 'reference',
+                  'created_ms', 'failure_status', 'correlation_id')
+
+
+# Column order of the COPY fast path
+COPY_COLUMNS = ('txn_id',) + UPDATE_COLUMNS
+
+
+def request_hash_for(row):
+    """Idempotency hash for a CSV row (the reference when available, for stability)."""
+    raw_ref = (row.get('reference') or '').strip()
+    if raw_ref:
+        return Idempotency.hash_request(raw_ref.encode('utf-8'))
+    # Use a stable serialization for hashing (same canonical form as the API)
+    return Idempotency.hash_request(orjson.dumps(row, option=orjson.OPT_SORT_KEYS))
+
+
+def add_daily_total(deltas, account_id, created_ms, amount_cents):
+    """Add amount_cents to deltas[(account_id, UTC day of created_ms)]."""
+    if account_id is not None:
+        deltas[account_id, (EPOCH + timedelta(milliseconds=created_ms)).date()] += amount_cents
+
+
+# Imported rows are added to account_daily_total rows that already exist; days with
+# no row yet are seeded from the transactions themselves on their next charge
+UPDATE_DAILY_TOTAL = (
+    update(AccountDailyTotal)
+    .where(AccountDailyTotal.account_id == bindparam('a'), AccountDailyTotal.day == bindparam('d'))
+    .values(total_cents=AccountDailyTotal.total_cents + bindparam('delta'))
+)
+
+
+# Rows are imported with the txn_ids from the file, which PostgreSQL's txn_id sequence
+# doesn't see; move it past them so later API inserts don't reuse an id
+SYNC_TXN_ID_SEQUENCE = (
+    "SELECT setval(pg_get_serial_sequence('transaction', 'txn_id'), "
+    "(SELECT COALESCE(max(txn_id), 1) FROM \"transaction\"))"
+)
+
+
+def sync_txn_id_sequence():
+    """Run SYNC_TXN_ID_SEQUENCE and commit (PostgreSQL only)."""
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(SYNC_TXN_ID_SEQUENCE))
+        db.session.commit()
+
+
+def read_chunks(reader, size):
+    """Yield lists of up to size rows from reader."""
+    while chunk := list(islice(reader, size)):
+        yield chunk
+
+
+def import_chunk(chunk, verbose=False):
+    """Insert or update one chunk of CSV rows and commit it as a single transaction.
+
+    Existing idempotency mappings and candidate transactions (by txn_id or reference)
+    for the whole chunk are loaded up front with IN queries, so the row loop only does
+    dict lookups; rows are then split into bulk updates (mapped transaction found) and
+    bulk inserts.
+    """
+    hashes = [request_hash_for(row) for row in chunk]
+    idem_keys = dict(db.session.execute(
+        select(Idempotency.request_hash, Idempotency.key).where(Idempotency.request_hash.in_(set(hashes)))
+    ).all())
+
+    txn_ids = {int(row['txn_id']) for row in chunk if row.get('txn_id')}
+    refs = {ref for ref in ((row.get('reference') or '').strip() for row in chunk) if ref}
+    txn_by_id = {
+        txn['txn_id']: dict(txn) for txn in db.session.execute(
+            select(Transaction.txn_id, *(getattr(Transaction, c) for c in UPDATE_COLUMNS))
+            .where(or_(Transaction.txn_id.in_(txn_ids), Transaction.reference.in_(refs)))
+        ).mappings()
+    }
+    txn_by_ref = {txn['reference']: txn for txn in txn_by_id.values() if txn['reference']}
+
+    inserts, mappings = [], []
+    updates = {}                        # txn_id -> update mapping
+    originals = {}                      # txn_id -> (account_id, created_ms, amount_cents) before the update
+    pending_by_id, pending_by_ref = {}, {}
+
+    def find(txn_id=None, reference=None):
+        """Return the mapping (pending insert or update) for a transaction, or None."""
+        pending = pending_by_id.get(txn_id) if txn_id else pending_by_ref.get(reference)
+        if pending is not None:
+            return pending
+        txn = txn_by_id.get(txn_id) if txn_id else txn_by_ref.get(reference)
+        if txn is not None:
+            updates[txn['txn_id']] = txn
+            originals.setdefault(txn['txn_id'], (txn['account_id'], txn['created_ms'], txn['amount_cents']))
+        return txn
+
+    for row, request_hash in zip(chunk, hashes):
+        raw_ref = (row.get('reference') or '').strip()
+        provided_txn_id = int(row.get('txn_id')) if row.get('txn_id') else None
+
+        # Determine correlation id: reuse existing mapping key if present, else generate new
+        idem = request_hash in idem_keys
+        corr_id = idem_keys[request_hash] if idem else str(uuid.uuid4())
+
+        # parse amount and created_dt
+        try:
+            amount = float(row.get('amount') or 0)
+        except ValueError:
+            amount = 0.0
+
+        created_dt = parse_date(row.get('created_at') or '')
+
+        # If idempotency exists, attempt to find the mapped transaction to update
+        existing = None
+        if idem:
+            # Prefer explicit txn_id if provided
+            if provided_txn_id:
+                existing = find(txn_id=provided_txn_id)
+            # Otherwise try to find by reference (if reference was used as request_hash)
+            if not existing and raw_ref:
+                existing = find(reference=raw_ref)
+
+        # If provided_txn_id is given and not found yet, try fetching by that id (safe path)
+        if not existing and provided_txn_id:
+            existing = find(txn_id=provided_txn_id)
+
+        if existing:
+            # Update existing transaction
+            existing['account_id'] = int(row.get('account_id')) if row.get('account_id') else existing['account_id']
+            existing['counterparty_id'] = row.get('counterparty_id') or existing['counterparty_id']
+            existing['amount_cents'] = to_cents(amount)
+            existing['txn_type'] = row.get('txn_type') or existing['txn_type']
+            existing['reference'] = raw_ref or existing['reference']
+            if created_dt:
+                existing['created_ms'] = to_epoch_ms(created_dt)
+            existing['failure_status'] = row.get('failure_status') or existing['failure_status']
+            existing['correlation_id'] = corr_id
+            if verbose:
+                print(f"Updated transaction txn_id={existing.get('txn_id')}")
+        else:
+            # Insert new transaction
+            new_transaction = {
+                'account_id': int(row.get('account_id')) if row.get('account_id') else None,
+                'counterparty_id': row.get('counterparty_id') or None,
+                'amount_cents': to_cents(amount),
+                'txn_type': row.get('txn_type'),
+                # Rows without a reference store NULL ('' would collide on the unique index)
+                'reference': raw_ref or None,
+                'created_ms': to_epoch_ms(created_dt) if created_dt else epoch_ms_now(),
+                'failure_status': row.get('failure_status') or None,
+                'correlation_id': corr_id
+            }
+            if provided_txn_id:
+                new_transaction['txn_id'] = provided_txn_id
+                pending_by_id[provided_txn_id] = new_transaction
+            if raw_ref:
+                pending_by_ref[raw_ref] = new_transaction
+            inserts.append(new_transaction)
+            if verbose:
+                print(f"Inserted transaction reference={raw_ref} txn_id={provided_txn_id}")
+
+        # Create idempotency mapping if none existed
+        if not idem:
+            mappings.append({'key': corr_id, 'request_hash': request_hash})
+            idem_keys[request_hash] = corr_id
+
+    # Net change per (account, day) for the daily-limit running totals
+    deltas = defaultdict(int)
+    for txn in inserts:
+        add_daily_total(deltas, txn['account_id'], txn['created_ms'], txn['amount_cents'])
+    for txn_id, txn in updates.items():
+        account_id, created_ms, amount_cents = originals[txn_id]
+        add_daily_total(deltas, account_id, created_ms, -amount_cents)
+        add_daily_total(deltas, txn['account_id'], txn['created_ms'], txn['amount_cents'])
+
+    db.session.bulk_update_mappings(Transaction, list(updates.values()))
+    db.session.bulk_insert_mappings(Transaction, inserts)
+    db.session.bulk_insert_mappings(Idempotency, mappings)
+    if any(deltas.values()):
+        db.session.connection().execute(
+            UPDATE_DAILY_TOTAL,
+            [{'a': a, 'd': d, 'delta': delta} for (a, d), delta in deltas.items() if delta]
+        )
+    db.session.commit()
+    return len(inserts), len(updates)
+
+
+def copy_import(csv_file, encoding):
+    """Cold-import fast path for PostgreSQL: COPY every row into the tables.
+
+    Only applies when no row can be an update (the idempotency table is empty) and
+    every row carries its txn_id. Returns the number of rows imported, or None when
+    the fast path does not apply; nothing is written in that case. Raises (after
+    rolling back) if the COPY fails, e.g. on a duplicate reference in the file.
+    """
+    if db.engine.dialect.name != 'postgresql' or db.engine.driver != 'psycopg2':
+        return None
+    if db.session.execute(select(Idempotency.key).limit(1)).first() is not None:
+        return None
+
+    transactions, mappings = io.StringIO(), io.StringIO()
+    txn_writer, idem_writer = csv.writer(transactions), csv.writer(mappings)
+    deltas = defaultdict(int)
+    count = 0
+    imported_at = datetime.utcnow().isoformat()
+    with open(csv_file, 'r', newline='', encoding=encoding) as file:
+        for row in csv.DictReader(file):
+            if not row.get('txn_id'):
+                return None
+            try:
+                amount = float(row.get('amount') or 0)
+            except ValueError:
+                amount = 0.0
+            created_dt = parse_date(row.get('created_at') or '')
+            corr_id = str(uuid.uuid4())
+            account_id = int(row['account_id']) if row.get('account_id') else None
+            created_ms = to_epoch_ms(created_dt) if created_dt else epoch_ms_now()
+            add_daily_total(deltas, account_id, created_ms, to_cents(amount))
+
+            # Empty optional fields are NULL, as in import_chunk; txn_type is loaded
+            # as written (FORCE_NOT_NULL keeps an empty one as '')
+            txn_writer.writerow([
+                int(row['txn_id']),
+                account_id,
+                row.get('counterparty_id') or None,
+                to_cents(amount),
+                row.get('txn_type'),
+                (row.get('reference') or '').strip() or None,
+                created_ms,
+                row.get('failure_status') or None,
+                corr_id
+            ])
+            # created_at only has a Python-side default, so COPY has to supply it
+            idem_writer.writerow([corr_id, request_hash_for(row), imported_at])
+            count += 1
+
+    transactions.seek(0)
+    mappings.seek(0)
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.copy_expert(f'COPY "transaction" ({", ".join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (txn_type))', transactions)
+        cursor.copy_expert('COPY idempotency (key, request_hash, created_at) FROM STDIN WITH CSV', mappings)
+        cursor.executemany(
+            "UPDATE account_daily_total SET total_cents = total_cents + %s WHERE account_id = %s AND day = %s",
+            [(delta, a, d) for (a, d), delta in deltas.items() if delta]
+        )
+        cursor.execute(SYNC_TXN_ID_SEQUENCE)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    return count
+
+
+def import_transactions(csv_file, force_recreate=False, verbose=False):
     """Import transactions from csv_file.
 
     Behavior:
       - If an Idempotency entry with the CSV reference exists, the mapped Transaction
         will be updated (idempotent update).
       - If not, a new Transaction is created and an Idempotency row is inserted.
-      - By default this will not drop existing tables; pass force_recreate=True to
-        drop & recreate all tables (destructive).
+      - On PostgreSQL, a cold import (empty idempotency table) is loaded with COPY;
+        if that is not possible the rows go through the chunked path below.
+      - Rows are written in chunks of CHUNK_SIZE with one commit per chunk; a chunk
+        that fails is rolled back and retried row by row, so only the bad rows are
+        skipped (and reported).
+      - The schema is brought to the latest migration first. By default this will not
+        drop existing tables; pass force_recreate=True to downgrade to an empty
+        database and migrate it up again (destructive).
     """
 
     app = create_app()
 
     with app.app_context():
+        # The schema is owned by the Alembic migrations, as at app start-up
         if force_recreate:
-            db.drop_all()
-        db.create_all()
+            downgrade(revision='base')
+        upgrade()
 
         if not csv_file:
             csv_file = os.getenv('CSV_FILE_PATH', 'transactions_1.csv')
 
-        with open(csv_file, 'r', newline='', encoding=os.getenv('CSV_ENCODING', 'utf-8')) as file:
-            csv_reader = csv.DictReader(file)
-
-            # Single loop over csv_reader (removed nested loop)
-            for row in csv_reader:
-                # compute request_hash (use reference when available for stability)
-                raw_ref = (row.get('reference') or '').strip()
-                if raw_ref:
-                    request_hash = raw_ref
-                else:
-                    # Use a stable serialization for hashing
-                    request_hash = hashlib.sha256(repr(sorted(row.items())).encode('utf-8')).hexdigest()
-
-                # Try to find an existing idempotency mapping by request_hash
-                idem = Idempotency.query.filter_by(request_hash=request_hash).first()
+        encoding = os.getenv('CSV_ENCODING', 'utf-8')
+        try:
+            copied = copy_import(csv_file, encoding)
+        except Exception as e:
+            print(f"COPY import failed, falling back to batched inserts: {e}")
+            copied = None
+        if copied is not None:
+            print(f"Imported {copied} new transactions with COPY")
+            return
 
-                provided_txn_id = int(row.get('txn_id')) if row.get('txn_id') else None
-
-                # Determine correlation id: reuse existing mapping key if present, else generate new
-                if idem and getattr(idem, 'key', None):
-                    corr_id = idem.key
-                else:
-                    corr_id = str(uuid.uuid4())
+        inserted = updated = 0
+        with open(csv_file, 'r', newline='', encoding=encoding) as file:
+            csv_reader = csv.DictReader(file)
 
-                # parse amount and created_dt
+            for number, chunk in enumerate(read_chunks(csv_reader, CHUNK_SIZE)):
                 try:
-                    amount = float(row.get('amount') or 0)
-                except ValueError:
-                    amount = 0.0
-
-                created_dt = parse_date(row.get('created_at') or '')
-
-                # If idempotency exists, attempt to find the mapped transaction to update
-                existing = None
-                if idar := idem:
-                    # Prefer explicit txn_id if provided
-                    if provided_txn_id:
-                        existing = Transaction.query.get(provided_txn_id)
-                    # Otherwise try to find by reference (if reference was used as request_hash)
-                    if not existing and raw_ref:
-                        existing = Transaction.query.filter_by(reference=raw_ref).first()
-
-                # If provided_txn_id is given and not found yet, try fetching by that id (safe path)
-                if not existing and provided_txn_id:
-                    existing = Transaction.query.get(provided_txn_id)
-
-                if existing:
-                    # Update existing transaction
-                    existing.account_id = int(row.get('account_id')) if row.get('account_id') else existing.account_id
-                    existing.counterparty_id = row.get('counterparty_id') or existing.counterparty_id
-                    existing.amount = amount
-                    existing.txn_type = row.get('txn_type') or existing.txn_type
-                    existing.reference = raw_ref or existing.reference
-                    if created_dt:
-                        existing.created_dt = created_dt
-                    existing.failure_status = row.get('failure_status') or existing.failure_status
-                    existing.correlation_id = corr_id
-                    try:
-                        db.session.commit()
-                        print(f"Updated transaction txn_id={existing.txn_id or existing.id}")
-                    except Exception as e:
-                        print(f"Error updating transaction for txn_id {provided_txn_id}: {e}")
-                        db.session.rollback()
-                    new_transaction = existing
-                else:
-                    # Insert new transaction
-                    new_transaction = Transaction(
-                        txn_id=provided_txn_id,
-                        account_id=int(row.get('account_id')) if row.get('account_id') else None,
-                        counterparty_id=row.get('counterparty_id'),
-                        amount=amount,
-                        txn_type=row.get('txn_type'),
-                        reference=raw_ref,
-                        created_dt=created_dt or datetime.utcnow(),
-                        failure_status=row.get('failure_status'),
-                        correlation_id=corr_id
-                    )
-                    db.session.add(new_transaction)
-                    try:
-                        db.session.commit()
-                        print(f"Inserted transaction reference={raw_ref} txn_id={new_transaction.txn_id or new_transaction.id}")
-                    except Exception as e:
-                        print(f"Error inserting transaction for reference {raw_ref}: {e}")
-                        db.session.rollback()
-
-                # Create idempotency mapping if none existed
-                if new_transaction and not idem:
-                    mapping = Idempotency(key=corr_id, request_hash=request_hash)
-                    db.session.add(mapping)
-                    try:
-                        db.session.commit()
-                    except Exception as e:
-                        print(f"Error creating idempotency mapping for correlation_id {corr_id}: {e}")
-                        db.session.rollback()
+                    chunk_inserted, chunk_updated = import_chunk(chunk, verbose=verbose)
+                    inserted += chunk_inserted
+                    updated += chunk_updated
+                except Exception:
+                    db.session.rollback()
+                    # Retry the chunk one row at a time so one bad row doesn't cost the rest
+                    first_row = number * CHUNK_SIZE + 1
+                    for row_number, row in enumerate(chunk, start=first_row):
+                        try:
+                            row_inserted, row_updated = import_chunk([row], verbose=verbose)
+                            inserted += row_inserted
+                            updated += row_updated
+                        except Exception as e:
+                            print(f"Error importing row {row_number}: {e}")
+                            db.session.rollback()
+
+        sync_txn_id_sequence()
+        print(f"Imported {inserted} new and {updated} updated transactions")
 
 
 # Add a CLI entrypoint so running the script actually executes the import
@@ -142,10 +351,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Import transactions from CSV.")
     parser.add_argument("csv_file", nargs="?", help="Path to CSV file (defaults to env CSV_FILE_PATH or transactions_1.csv)")
     parser.add_argument("--force", action="store_true", help="Drop and recreate tables before importing")
+    parser.add_argument("--verbose", action="store_true", help="Print every inserted/updated transaction")
     args = parser.parse_args()
 
     try:
-        import_transactions(args.csv_file, force_recreate=args.force)
+        import_transactions(args.csv_file, force_recreate=args.force, verbose=args.verbose)
     except FileNotFoundError:
         print(f"CSV file not found: {args.csv_file or os.getenv('CSV_FILE_PATH','transactions_1.csv')}", file=sys.stderr)
         sys.exit(2)
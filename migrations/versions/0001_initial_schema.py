@@ -0,0 +1,63 @@
+"""initial schema
+
+Matches the tables db.create_all() produced before migrations were added.
+Databases created that way should be stamped at this revision
+(`flask db stamp 0001`) and then upgraded.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all() emitted idempotency.key -> transaction.correlation_id, which SQLite
+    # accepts without enforcing; other databases refuse a foreign key to a non-unique
+    # column, so it is only created on SQLite (and dropped again in 0006)
+    idempotency_fk = []
+    if op.get_bind().dialect.name == 'sqlite':
+        idempotency_fk.append(sa.ForeignKeyConstraint(['key'], ['transaction.correlation_id']))
+
+    op.create_table(
+        'transaction',
+        sa.Column('txn_id', sa.Integer(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=True),
+        sa.Column('counterparty_id', sa.String(length=128), nullable=True),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('txn_type', sa.String(length=50), nullable=False),
+        sa.Column('reference', sa.String(length=128), nullable=True),
+        sa.Column('created_dt', sa.DateTime(), nullable=False),
+        sa.Column('failure_status', sa.String(length=200), nullable=True),
+        sa.Column('correlation_id', sa.String(length=128), nullable=True),
+        sa.PrimaryKeyConstraint('txn_id')
+    )
+    op.create_index('ix_transaction_account_id', 'transaction', ['account_id'])
+    op.create_index('ix_transaction_correlation_id', 'transaction', ['correlation_id'])
+    op.create_index('ix_transaction_reference', 'transaction', ['reference'], unique=True)
+
+    op.create_table(
+        'idempotency',
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('request_hash', sa.String(length=128), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key', 'request_hash'),
+        *idempotency_fk
+    )
+
+
+def downgrade():
+    op.drop_table('idempotency')
+    op.drop_index('ix_transaction_reference', table_name='transaction')
+    op.drop_index('ix_transaction_correlation_id', table_name='transaction')
+    op.drop_index('ix_transaction_account_id', table_name='transaction')
+    op.drop_table('transaction')
@@ -0,0 +1,120 @@
+"""daily totals, epoch-ms timestamps, integer cents, BLAKE2b request hashes
+
+- transaction.created_dt (DATETIME) -> created_ms (BIGINT epoch milliseconds)
+- transaction.amount (FLOAT) -> amount_cents (BIGINT)
+- ix_txn_account_date on (account_id, created_ms) for the daily-limit SUM
+- account_daily_total running totals table
+- idempotency.request_hash narrowed to CHAR(32). Importer mappings stored the raw
+  CSV reference, whose new hash is BLAKE2b-128 of that reference, so they are
+  rehashed in place. SHA-256 payload hashes (64 hex chars) can't be recomputed;
+  they are truncated to 32 chars, which no BLAKE2b-128 hash will match, so the key
+  stays taken and a retry of a pre-upgrade request gets 422 instead of running again
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import hashlib
+import re
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+CREATED_MS_FROM_DT = {
+    'sqlite': "CAST(ROUND((julianday(created_dt) - 2440587.5) * 86400000) AS INTEGER)",
+    'postgresql': "CAST(ROUND(EXTRACT(EPOCH FROM created_dt) * 1000) AS BIGINT)",
+}
+
+SHA256_HEX = re.compile(r'[0-9a-f]{64}')
+
+CREATED_DT_FROM_MS = {
+    'sqlite': "strftime('%Y-%m-%d %H:%M:%f', created_ms / 1000.0, 'unixepoch')",
+    'postgresql': "to_timestamp(created_ms / 1000.0) AT TIME ZONE 'UTC'",
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.add_column(sa.Column('created_ms', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('amount_cents', sa.BigInteger(), nullable=True))
+
+    op.execute(
+        f'UPDATE "transaction" SET created_ms = {CREATED_MS_FROM_DT[dialect]}, '
+        'amount_cents = CAST(ROUND(amount * 100) AS BIGINT)'
+    )
+
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.alter_column('created_ms', existing_type=sa.BigInteger(), nullable=False)
+        batch_op.alter_column('amount_cents', existing_type=sa.BigInteger(), nullable=False)
+        batch_op.drop_column('created_dt')
+        batch_op.drop_column('amount')
+
+    op.create_index(
+        'ix_txn_account_date', 'transaction', ['account_id', 'created_ms'],
+        postgresql_include=['amount_cents']
+    )
+
+    op.create_table(
+        'account_daily_total',
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('total_cents', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('account_id', 'day')
+    )
+
+    bind = op.get_bind()
+    rehashed = []
+    for key, request_hash in bind.execute(sa.text('SELECT key, request_hash FROM idempotency')):
+        if SHA256_HEX.fullmatch(request_hash):
+            new = request_hash[:32]
+        else:
+            new = hashlib.blake2b(request_hash.encode('utf-8'), digest_size=16).hexdigest()
+        rehashed.append({'key': key, 'old': request_hash, 'new': new})
+    if rehashed:
+        bind.execute(
+            sa.text('UPDATE idempotency SET request_hash = :new WHERE key = :key AND request_hash = :old'),
+            rehashed
+        )
+    with op.batch_alter_table('idempotency') as batch_op:
+        batch_op.alter_column(
+            'request_hash', existing_type=sa.String(length=128), type_=sa.CHAR(length=32),
+            existing_nullable=False
+        )
+
+
+def downgrade():
+    # Rehashed request hashes are left as they are; BLAKE2b can't be reversed
+    dialect = op.get_bind().dialect.name
+
+    with op.batch_alter_table('idempotency') as batch_op:
+        batch_op.alter_column(
+            'request_hash', existing_type=sa.CHAR(length=32), type_=sa.String(length=128),
+            existing_nullable=False
+        )
+
+    op.drop_table('account_daily_total')
+    op.drop_index('ix_txn_account_date', table_name='transaction')
+
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.add_column(sa.Column('created_dt', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('amount', sa.Float(), nullable=True))
+
+    op.execute(
+        f'UPDATE "transaction" SET created_dt = {CREATED_DT_FROM_MS[dialect]}, '
+        'amount = amount_cents / 100.0'
+    )
+
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.alter_column('created_dt', existing_type=sa.DateTime(), nullable=False)
+        batch_op.alter_column('amount', existing_type=sa.Float(), nullable=False)
+        batch_op.drop_column('created_ms')
+        batch_op.drop_column('amount_cents')
@@ -0,0 +1,37 @@
+"""store idempotency as a WITHOUT ROWID table on SQLite
+
+The (key, request_hash) primary key becomes the table's clustered b-tree, so
+duplicate checks no longer go primary-key index -> rowid -> table row.
+No-op on other databases.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def _recreate(with_rowid):
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table(
+        'idempotency', recreate='always', table_kwargs={'sqlite_with_rowid': with_rowid}
+    ):
+        pass
+
+
+def upgrade():
+    _recreate(with_rowid=False)
+
+
+def downgrade():
+    _recreate(with_rowid=True)
@@ -0,0 +1,34 @@
+"""balance_outbox table for asynchronous update-balance calls
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'balance_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_ms', sa.BigInteger(), nullable=False),
+        sa.Column('created_ms', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_balance_outbox_next_attempt_ms', 'balance_outbox', ['next_attempt_ms'])
+
+
+def downgrade():
+    op.drop_index('ix_balance_outbox_next_attempt_ms', table_name='balance_outbox')
+    op.drop_table('balance_outbox')
@@ -0,0 +1,34 @@
+"""balance_outbox.dead_ms for updates that are no longer retried
+
+Rows the accounts service rejects for good (or that ran out of attempts) are kept
+with dead_ms set. The due-row index becomes (dead_ms, next_attempt_ms) so the
+worker's scan skips them.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('balance_outbox') as batch_op:
+        batch_op.add_column(sa.Column('dead_ms', sa.BigInteger(), nullable=True))
+    op.drop_index('ix_balance_outbox_next_attempt_ms', table_name='balance_outbox')
+    op.create_index('ix_balance_outbox_due', 'balance_outbox', ['dead_ms', 'next_attempt_ms'])
+
+
+def downgrade():
+    op.drop_index('ix_balance_outbox_due', table_name='balance_outbox')
+    op.create_index('ix_balance_outbox_next_attempt_ms', 'balance_outbox', ['next_attempt_ms'])
+    with op.batch_alter_table('balance_outbox') as batch_op:
+        batch_op.drop_column('dead_ms')
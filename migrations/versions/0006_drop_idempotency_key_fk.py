@@ -0,0 +1,52 @@
+"""drop the idempotency.key foreign key
+
+transaction.correlation_id is not unique (a transfer writes two rows with the same
+one), so the key can't reference it on databases that enforce foreign keys. Only
+SQLite ever had the constraint (see 0001); the table is rebuilt without it there.
+No-op on other databases.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def _idempotency_table(*constraints):
+    return sa.Table(
+        'idempotency',
+        sa.MetaData(),
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('request_hash', sa.CHAR(length=32), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key', 'request_hash'),
+        *constraints
+    )
+
+
+def _recreate(table):
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    # the FK is unnamed, so the rebuilt table is given explicitly rather than reflected
+    with op.batch_alter_table(
+        'idempotency', copy_from=table, recreate='always',
+        table_kwargs={'sqlite_with_rowid': False}
+    ):
+        pass
+
+
+def upgrade():
+    _recreate(_idempotency_table())
+
+
+def downgrade():
+    _recreate(_idempotency_table(sa.ForeignKeyConstraint(['key'], ['transaction.correlation_id'])))
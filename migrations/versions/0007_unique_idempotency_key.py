@@ -0,0 +1,35 @@
+"""unique idempotency.key
+
+One correlation_id maps to one request, so the key is made unique: a concurrent
+request reusing it (with the same or a different payload) now fails its insert
+instead of adding a second mapping. Extra mappings for a key are dropped first,
+keeping the oldest.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        'DELETE FROM idempotency WHERE EXISTS ('
+        'SELECT 1 FROM idempotency AS older WHERE older.key = idempotency.key AND ('
+        'older.created_at < idempotency.created_at OR ('
+        'older.created_at = idempotency.created_at AND older.request_hash < idempotency.request_hash)))'
+    )
+    op.create_index('ix_idempotency_key', 'idempotency', ['key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_key', table_name='idempotency')
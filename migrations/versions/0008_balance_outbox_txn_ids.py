@@ -0,0 +1,29 @@
+"""balance_outbox.txn_ids
+
+The txn_ids of the transaction rows an update belongs to, so a dead update can be
+traced back (and its transactions flagged as failed).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('balance_outbox') as batch_op:
+        batch_op.add_column(sa.Column('txn_ids', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('balance_outbox') as batch_op:
+        batch_op.drop_column('txn_ids')
@@ -0,0 +1,27 @@
+"""index idempotency.request_hash
+
+The importer looks mappings up by request_hash alone (one IN query per chunk),
+which the (key, request_hash) primary key can't serve.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_idempotency_request_hash', 'idempotency', ['request_hash'])
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_request_hash', table_name='idempotency')
@@ -0,0 +1,54 @@
+"""idempotency primary key on key alone
+
+Since 0007 key is unique on its own, so the (key, request_hash) primary key and the
+separate unique index on key are collapsed into a primary key on key.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def _idempotency_table(*primary_key):
+    return sa.Table(
+        'idempotency',
+        sa.MetaData(),
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('request_hash', sa.CHAR(length=32), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint(*primary_key),
+        sa.Index('ix_idempotency_request_hash', 'request_hash'),
+    )
+
+
+def _set_primary_key(*columns):
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite can't alter a primary key (and this one is unnamed): rebuild the table
+        with op.batch_alter_table(
+            'idempotency', copy_from=_idempotency_table(*columns), recreate='always',
+            table_kwargs={'sqlite_with_rowid': False}
+        ):
+            pass
+    else:
+        op.drop_constraint('idempotency_pkey', 'idempotency', type_='primary')
+        op.create_primary_key('idempotency_pkey', 'idempotency', list(columns))
+
+
+def upgrade():
+    op.drop_index('ix_idempotency_key', table_name='idempotency')
+    _set_primary_key('key')
+
+
+def downgrade():
+    _set_primary_key('key', 'request_hash')
+    op.create_index('ix_idempotency_key', 'idempotency', ['key'], unique=True)
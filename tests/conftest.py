@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from app import create_app, db, routes
+from app.models import AccountDailyTotal, BalanceOutbox, Idempotency, Transaction
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None, text=''):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = text
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # One app per session: create_app registers Prometheus metrics, which can only
+    # happen once per process
+    db_path = tmp_path_factory.mktemp('db') / 'transactions.db'
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    os.environ['RUN_MIGRATIONS'] = '1'
+    app = create_app()
+    app.config['TESTING'] = True
+    # Keep the outbox and notification threads from starting; tests drive them directly
+    routes._outbox_pid = routes._notifier_pid = os.getpid()
+    return app
+
+
+@pytest.fixture(autouse=True)
+def clean_state(app):
+    with app.app_context():
+        for model in (Idempotency, BalanceOutbox, AccountDailyTotal, Transaction):
+            db.session.query(model).delete()
+        db.session.commit()
+    routes._SEEDED_TOTALS.clear()
+    routes._IDEMPOTENCY_CACHE.clear()
+    routes._TXN_CACHE.clear()
+    while not routes.notify_queue.empty():
+        routes.notify_queue.get_nowait()
+    yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def accounts(monkeypatch):
+    """Replace the accounts service: records posted (url, json) pairs and answers the
+    transfer check with two active accounts holding `balance`."""
+    calls = []
+    state = {'balance': 1_000_000, 'status_code': 200}
+
+    def post(url, json=None, timeout=None):
+        calls.append((url, json))
+        if url == routes.ACCOUNTS_CHECK_URL:
+            account = {'status': 'ACTIVE', 'balance': state['balance']}
+            return FakeResponse(payload={'account': account, 'counterparty': dict(account)})
+        return FakeResponse(status_code=state['status_code'], text='refused')
+
+    monkeypatch.setattr(routes._SESSION, 'post', post)
+    state['calls'] = calls
+    return state
@@ -0,0 +1,79 @@
+from app import db, routes
+from app.models import AccountDailyTotal, Transaction, epoch_ms_now, to_epoch_ms
+
+
+def deposit(client, amount, account_id=1, **extra):
+    return client.post('/transactions', json={
+        'account_id': account_id, 'amount': str(amount), 'txn_type': 'deposit', **extra
+    })
+
+
+def daily_totals(app):
+    with app.app_context():
+        return {
+            (row.account_id, row.day.isoformat()): row.total_cents
+            for row in db.session.query(AccountDailyTotal)
+        }
+
+
+def test_first_charge_seeds_from_rows_already_written_today(app, client):
+    with app.app_context():
+        db.session.add(Transaction(account_id=1, amount_cents=30000, txn_type='deposit', created_ms=epoch_ms_now()))
+        db.session.commit()
+
+    assert deposit(client, 100).status_code == 201
+
+    _, _, today = routes._current_day()
+    assert daily_totals(app) == {(1, today.isoformat()): 40000}
+
+
+def test_later_charges_are_added_to_the_existing_total(app, client):
+    assert deposit(client, 100).status_code == 201
+    _, _, today = routes._current_day()
+    assert (1, today) in routes._SEEDED_TOTALS
+
+    assert deposit(client, 250.5).status_code == 201
+    assert daily_totals(app) == {(1, today.isoformat()): 35050}
+
+
+def test_charge_over_the_limit_is_rejected_and_rolled_back(app, client):
+    assert deposit(client, routes.DAILY_LIMIT - 100).status_code == 201
+
+    resp = deposit(client, 200)
+    assert resp.status_code == 400
+    assert 'Daily transaction limit' in resp.get_json()['error']
+
+    _, _, today = routes._current_day()
+    assert daily_totals(app) == {(1, today.isoformat()): (routes.DAILY_LIMIT - 100) * 100}
+    with app.app_context():
+        assert db.session.query(Transaction).count() == 1
+
+
+def test_single_amount_over_the_limit_is_rejected_without_a_write(app, client):
+    assert deposit(client, routes.DAILY_LIMIT + 1).status_code == 400
+    assert daily_totals(app) == {}
+
+
+def test_backdated_row_is_charged_to_its_own_day(app, client):
+    assert deposit(client, routes.DAILY_LIMIT, created_dt='2025-01-01T10:00:00').status_code == 201
+    assert deposit(client, 100).status_code == 201
+    assert deposit(client, 1, created_dt='2025-01-01T23:59:59').status_code == 400
+
+    _, _, today = routes._current_day()
+    assert daily_totals(app) == {
+        (1, '2025-01-01'): routes.DAILY_LIMIT * 100,
+        (1, today.isoformat()): 10000,
+    }
+    with app.app_context():
+        day_start = to_epoch_ms('2025-01-01T00:00:00')
+        assert db.session.query(Transaction).filter(Transaction.created_ms >= day_start).count() == 2
+
+
+def test_transfer_checks_only_the_senders_total(app, client, accounts):
+    resp = client.post('/transactions', json={
+        'account_id': 1, 'counterparty_id': '2', 'amount': '75', 'txn_type': 'transfer'
+    })
+    assert resp.status_code == 201
+
+    _, _, today = routes._current_day()
+    assert daily_totals(app) == {(1, today.isoformat()): -7500, (2, today.isoformat()): 7500}
@@ -0,0 +1,59 @@
+from app import db, routes
+from app.models import Idempotency, Transaction
+
+PAYLOAD = {'account_id': 1, 'amount': '10', 'txn_type': 'deposit', 'correlation_id': 'corr-1'}
+
+
+def test_same_request_again_is_409_with_the_original_txn_id(client):
+    first = client.post('/transactions', json=PAYLOAD)
+    assert first.status_code == 201
+
+    again = client.post('/transactions', json=PAYLOAD)
+    assert again.status_code == 409
+    assert again.get_json() == {'message': 'Duplicate transaction', 'original_txn_id': first.get_json()['txn_id']}
+
+
+def test_duplicate_is_found_in_the_database_once_the_cache_is_gone(client):
+    txn_id = client.post('/transactions', json=PAYLOAD).get_json()['txn_id']
+    routes._IDEMPOTENCY_CACHE.clear()
+
+    again = client.post('/transactions', json=PAYLOAD)
+    assert again.status_code == 409
+    assert again.get_json()['original_txn_id'] == txn_id
+
+
+def test_reused_correlation_id_with_a_different_payload_is_422(app, client):
+    assert client.post('/transactions', json=PAYLOAD).status_code == 201
+
+    resp = client.post('/transactions', json={**PAYLOAD, 'amount': '11'})
+    assert resp.status_code == 422
+    with app.app_context():
+        assert db.session.query(Transaction).count() == 1
+        assert db.session.query(Idempotency).count() == 1
+
+
+def test_request_losing_the_race_gets_409_or_422_not_500(app, client, monkeypatch):
+    txn_id = client.post('/transactions', json=PAYLOAD).get_json()['txn_id']
+    routes._IDEMPOTENCY_CACHE.clear()
+
+    # Make the up-front check miss, as if the other request committed just after it
+    real_replay = routes._idempotent_replay
+    calls = []
+
+    def replay_after_insert(*args):
+        calls.append(args)
+        return None if len(calls) == 1 else real_replay(*args)
+
+    monkeypatch.setattr(routes, '_idempotent_replay', replay_after_insert)
+    resp = client.post('/transactions', json=PAYLOAD)
+    assert resp.status_code == 409
+    assert resp.get_json()['original_txn_id'] == txn_id
+
+    calls.clear()
+    resp = client.post('/transactions', json={**PAYLOAD, 'amount': '12'})
+    assert resp.status_code == 422
+
+    _, _, today = routes._current_day()
+    with app.app_context():
+        assert db.session.query(Transaction).count() == 1
+        assert db.session.get(routes.AccountDailyTotal, (1, today)).total_cents == 1000
@@ -0,0 +1,112 @@
+import csv
+from datetime import date
+
+import import_transactions
+from app import db
+from app.models import AccountDailyTotal, Idempotency, Transaction
+from import_transactions import import_chunk
+
+FIELDS = ('txn_id', 'account_id', 'amount', 'txn_type', 'counterparty_id', 'failure_status', 'reference', 'created_at')
+
+
+def csv_row(**values):
+    row = dict.fromkeys(FIELDS, '')
+    row.update(account_id='16', amount='100', txn_type='DEPOSIT', created_at='27-04-2025 15:38')
+    row.update(values)
+    return row
+
+
+def transactions(app):
+    with app.app_context():
+        return {txn.reference: txn for txn in db.session.query(Transaction)}
+
+
+def daily_total(app, account_id, day):
+    with app.app_context():
+        row = db.session.get(AccountDailyTotal, (account_id, day))
+        return row.total_cents if row else None
+
+
+def test_new_rows_are_inserted_with_their_idempotency_mappings(app):
+    with app.app_context():
+        assert import_chunk([
+            csv_row(txn_id='1', reference='REF-1', counterparty_id='IMPS:External'),
+            csv_row(txn_id='2', reference=' REF-2 ', amount='12.34', failure_status='FAILURE: LOCKED'),
+            csv_row(txn_id='3'),
+        ]) == (3, 0)
+
+    txns = transactions(app)
+    assert set(txns) == {'REF-1', 'REF-2', None}
+    assert txns['REF-2'].txn_id == 2 and txns['REF-2'].amount_cents == 1234
+    assert txns['REF-2'].counterparty_id is None
+    assert txns[None].failure_status is None
+    with app.app_context():
+        mappings = dict(db.session.query(Idempotency.request_hash, Idempotency.key))
+    assert mappings[Idempotency.hash_request(b'REF-1')] == txns['REF-1'].correlation_id
+    assert len(mappings) == 3
+
+
+def test_reimported_rows_update_the_mapped_transaction(app):
+    with app.app_context():
+        import_chunk([csv_row(txn_id='1', reference='REF-1')])
+        assert import_chunk([csv_row(txn_id='1', reference='REF-1', amount='250', txn_type='WITHDRAWAL')]) == (0, 1)
+
+    txn = transactions(app)['REF-1']
+    assert (txn.amount_cents, txn.txn_type) == (25000, 'WITHDRAWAL')
+    with app.app_context():
+        assert db.session.query(Transaction).count() == 1
+        assert db.session.query(Idempotency).count() == 1
+
+
+def test_rows_repeated_within_a_chunk_are_merged(app):
+    with app.app_context():
+        assert import_chunk([
+            csv_row(txn_id='1', reference='REF-1'),
+            csv_row(txn_id='1', reference='REF-1', amount='7'),
+        ]) == (1, 0)
+    assert transactions(app)['REF-1'].amount_cents == 700
+
+
+def test_existing_daily_totals_get_the_imported_deltas(app):
+    day = date(2025, 4, 27)
+    with app.app_context():
+        db.session.add_all([
+            AccountDailyTotal(account_id=16, day=day, total_cents=500),
+            AccountDailyTotal(account_id=17, day=day, total_cents=0),
+        ])
+        db.session.commit()
+
+        import_chunk([csv_row(txn_id='1', reference='REF-1'), csv_row(txn_id='2', reference='REF-2', amount='1')])
+        assert daily_total(app, 16, day) == 500 + 10000 + 100
+
+        # An update moves the difference; moving the row to another account moves all of it
+        import_chunk([csv_row(txn_id='1', reference='REF-1', amount='40')])
+        assert daily_total(app, 16, day) == 500 + 4000 + 100
+        import_chunk([csv_row(txn_id='1', reference='REF-1', amount='40', account_id='17')])
+        assert daily_total(app, 16, day) == 500 + 100
+        assert daily_total(app, 17, day) == 4000
+
+    # Days without a row are left for the API's first charge to seed
+    assert daily_total(app, 16, date(2025, 4, 28)) is None
+
+
+def test_bad_row_only_skips_itself(app, tmp_path, monkeypatch, capsys):
+    csv_file = tmp_path / 'transactions.csv'
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows([
+            csv_row(txn_id='1', reference='REF-1'),
+            csv_row(txn_id='2', reference='REF-2', account_id='not-a-number'),
+            csv_row(txn_id='3', reference='REF-3'),
+        ])
+
+    # Reuse the session's app (and its already migrated database)
+    monkeypatch.setattr(import_transactions, 'create_app', lambda: app)
+    monkeypatch.setattr(import_transactions, 'upgrade', lambda: None)
+    import_transactions.import_transactions(str(csv_file))
+
+    assert set(transactions(app)) == {'REF-1', 'REF-3'}
+    out = capsys.readouterr().out
+    assert 'Error importing row 2' in out
+    assert 'Imported 2 new and 0 updated transactions' in out
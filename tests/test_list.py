@@ -0,0 +1,45 @@
+from app import db
+from app.models import Transaction
+
+
+def add_transactions(app, count):
+    with app.app_context():
+        db.session.add_all([
+            Transaction(account_id=1, amount_cents=100 * n, txn_type='deposit', created_ms=1_700_000_000_000 + n)
+            for n in range(1, count + 1)
+        ])
+        db.session.commit()
+
+
+def fetch_all(client, limit):
+    """Follow X-Next-Cursor from the first page; returns the pages' txn_ids."""
+    pages, url = [], f'/transactions?limit={limit}'
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        pages.append([txn['txn_id'] for txn in resp.get_json()])
+        cursor = resp.headers.get('X-Next-Cursor')
+        url = cursor and f'/transactions?limit={limit}&cursor={cursor}'
+    return pages
+
+
+def test_pages_follow_the_cursor_until_the_last_one(app, client):
+    add_transactions(app, 5)
+    assert fetch_all(client, 2) == [[1, 2], [3, 4], [5]]
+
+
+def test_exactly_full_last_page_has_no_cursor(app, client):
+    add_transactions(app, 4)
+    assert fetch_all(client, 2) == [[1, 2], [3, 4]]
+
+
+def test_empty_table_is_one_empty_page(client):
+    assert fetch_all(client, 2) == [[]]
+
+
+def test_rows_carry_amount_and_both_timestamps(app, client):
+    add_transactions(app, 1)
+    [txn] = client.get('/transactions').get_json()
+    assert txn['amount'] == 1.0
+    assert txn['created_ms'] == 1_700_000_000_001
+    assert txn['created_dt'] == '2023-11-14T22:13:20.001000'
@@ -0,0 +1,141 @@
+import logging
+
+import orjson
+import requests
+from prometheus_client import REGISTRY
+
+from app import db, routes
+from app.models import BalanceOutbox, Transaction, epoch_ms_now
+
+LOGGER = logging.getLogger('test_outbox')
+
+
+def queue_update(app, payload=None, **columns):
+    with app.app_context():
+        row = BalanceOutbox(payload=orjson.dumps(payload or {'account_id': 1, 'amount': 5.0}).decode(), **columns)
+        db.session.add(row)
+        db.session.commit()
+        return row.id
+
+
+def outbox_row(app, row_id):
+    with app.app_context():
+        return db.session.get(BalanceOutbox, row_id)
+
+
+def process(app):
+    with app.app_context():
+        return routes._process_outbox(LOGGER)
+
+
+def test_committed_transaction_queues_its_balance_update(app, client, accounts):
+    assert client.post('/transactions', json={'account_id': 1, 'amount': '5', 'txn_type': 'deposit'}).status_code == 201
+    assert accounts['calls'] == []
+
+    assert process(app) == 1
+    assert accounts['calls'] == [(routes.ACCOUNTS_UPDATE_URL, {'account_id': 1, 'amount': 5.0, 'txn_type': 'deposit'})]
+    with app.app_context():
+        assert db.session.query(BalanceOutbox).count() == 0
+
+
+def test_failed_update_is_rescheduled_with_backoff(app, accounts):
+    accounts['status_code'] = 503
+    row_id = queue_update(app)
+
+    before = epoch_ms_now()
+    assert process(app) == 1
+    row = outbox_row(app, row_id)
+    assert row.attempts == 1 and row.dead_ms is None
+    assert row.next_attempt_ms >= before + 1000
+
+    # Not due yet, so the next pass leaves it alone
+    assert process(app) == 0
+    assert len(accounts['calls']) == 1
+
+
+def test_throttled_and_timed_out_updates_are_retried(app, accounts):
+    for status_code in (408, 429):
+        accounts['status_code'] = status_code
+        row_id = queue_update(app)
+        process(app)
+        assert outbox_row(app, row_id).dead_ms is None
+
+
+def test_connection_errors_are_retried(app, monkeypatch):
+    def refuse(url, json=None, timeout=None):
+        raise requests.exceptions.ConnectionError('refused')
+
+    monkeypatch.setattr(routes._SESSION, 'post', refuse)
+    row_id = queue_update(app)
+    process(app)
+    row = outbox_row(app, row_id)
+    assert row.attempts == 1 and row.dead_ms is None
+
+
+def test_rejected_update_is_marked_dead_and_not_sent_again(app, accounts, caplog):
+    accounts['status_code'] = 400
+    row_id = queue_update(app)
+
+    with caplog.at_level(logging.ERROR, logger=LOGGER.name):
+        process(app)
+    row = outbox_row(app, row_id)
+    assert row.dead_ms is not None and row.attempts == 1
+    assert any(record.levelno == logging.ERROR for record in caplog.records)
+
+    with app.app_context():
+        db.session.query(BalanceOutbox).update({'next_attempt_ms': 0})
+        db.session.commit()
+    assert process(app) == 0
+    assert len(accounts['calls']) == 1
+
+
+def test_dead_update_flags_its_transactions_as_failed(app, client, accounts):
+    resp = client.post('/transactions', json={
+        'account_id': 1, 'counterparty_id': '2', 'amount': '5', 'txn_type': 'transfer'
+    })
+    txn_ids = [resp.get_json()['withdrawal_txn_id'], resp.get_json()['deposit_txn_id']]
+    with app.app_context():
+        assert orjson.loads(db.session.query(BalanceOutbox.txn_ids).scalar()) == txn_ids
+    # Cached before the update is given up on
+    assert client.get(f'/transactions/{txn_ids[0]}').get_json()['failure_status'] is None
+
+    accounts['status_code'] = 404
+    assert REGISTRY.get_sample_value('balance_outbox_dead_rows') == 0
+    process(app)
+    assert REGISTRY.get_sample_value('balance_outbox_dead_rows') == 1
+
+    with app.app_context():
+        flagged = db.session.query(Transaction.failure_status).filter(Transaction.txn_id.in_(txn_ids)).all()
+    assert flagged == [(routes.BALANCE_UPDATE_FAILED,)] * 2
+    assert client.get(f'/transactions/{txn_ids[0]}').get_json()['failure_status'] == routes.BALANCE_UPDATE_FAILED
+
+
+def test_update_is_abandoned_after_max_attempts(app, accounts):
+    accounts['status_code'] = 500
+    row_id = queue_update(app, attempts=routes.OUTBOX_MAX_ATTEMPTS - 1)
+    process(app)
+    row = outbox_row(app, row_id)
+    assert row.attempts == routes.OUTBOX_MAX_ATTEMPTS
+    assert row.dead_ms is not None
+
+
+def test_row_claimed_by_another_worker_is_skipped(app, accounts, monkeypatch):
+    row_id = queue_update(app)
+
+    # Another worker claims the row between this worker's read and its claim
+    real_execute = db.session.execute
+
+    def claim_first(statement, *args, **kwargs):
+        if getattr(statement, 'is_update', False) and not getattr(claim_first, 'done', False):
+            claim_first.done = True
+            real_execute(
+                routes.update(BalanceOutbox).where(BalanceOutbox.id == row_id)
+                .values(next_attempt_ms=epoch_ms_now() + routes.OUTBOX_LEASE_MS)
+            )
+        return real_execute(statement, *args, **kwargs)
+
+    with app.app_context():
+        monkeypatch.setattr(db.session, 'execute', claim_first)
+        assert routes._process_outbox(LOGGER) == 1
+    assert accounts['calls'] == []
+    assert outbox_row(app, row_id) is not None